@@ -1,6 +1,25 @@
+import importlib
+
+from .conversion import convert
 from .core import Quantity
+from .func import fsum, prod, weighted_mean
+from .snapshot import defined_systems
 from .util import Importer
 
 Importer.enable()
 Importer.inject_extended_functions(globals())
 del Importer
+
+def __getattr__(name):
+  # NumPy is an optional dependency, and is only imported for arrays
+  if name == 'QuantityArray':
+    try:
+      from .array import QuantityArray
+    except ImportError as error:
+      raise AttributeError('QuantityArray requires NumPy') from error
+    return QuantityArray
+  # the virtual module of a system is only built when it is first used
+  if name in defined_systems:
+    return importlib.import_module('{}.{}'.format(__name__, name))
+  raise AttributeError('module {!r} has no attribute {!r}'.format(
+    __name__, name))
@@ -1,7 +1,10 @@
 import argparse
+import asyncio
+import sys
 import unittest
 
-from .define import defined_systems
+from . import bench, server
+from .snapshot import build_systems, defined_systems, save_systems
 from .test import PhysicalQuantitiesTest
 
 def print_units(system):
@@ -36,6 +39,35 @@ if __name__ == '__main__':
     help='run unit tests',
     description='Run unit tests.')
 
+  cache_subparser = subparsers.add_parser('cache',
+    help='rebuild cache of unit systems',
+    description='Rebuild the cache files of defined unit systems.')
+
+  bench_subparser = subparsers.add_parser('bench',
+    help='run benchmarks',
+    description='Time common operations and imports of unit systems.')
+  bench_subparser.add_argument('-o', '--output',
+    help='save results as JSON to this file')
+  bench_subparser.add_argument('-c', '--compare',
+    help='compare results with those saved in this file')
+  bench_subparser.add_argument('-t', '--threshold',
+    type=float, default=0.1,
+    help='relative slowdown reported as a regression (default: 0.1)')
+  bench_subparser.add_argument('-r', '--repeat',
+    type=int, default=5,
+    help='number of repetitions of each benchmark (default: 5)')
+  bench_subparser.add_argument('--no-imports',
+    dest='imports', action='store_false',
+    help='skip timing imports of unit systems')
+
+  serve_subparser = subparsers.add_parser('serve',
+    help='evaluate requests as a server',
+    description='Evaluate expressions given as newline-delimited JSON '
+      'requests, such as {"system": "si", "expr": "G*MSun/c**2", '
+      '"to": "AU"}, until the end of the input.')
+  serve_subparser.add_argument('-s', '--socket',
+    help='listen on this Unix socket instead of standard input')
+
   args = parser.parse_args()
 
   if args.mode == 'list':
@@ -46,3 +78,25 @@ if __name__ == '__main__':
     print_constants(system)
   elif args.mode == 'test':
     unittest.TextTestRunner().run(unittest.makeSuite(PhysicalQuantitiesTest))
+  elif args.mode == 'cache':
+    for path in save_systems(build_systems()):
+      print('Saved {}'.format(path))
+  elif args.mode == 'bench':
+    results = bench.run_benchmarks(args.repeat, args.imports)
+    if args.output:
+      bench.save_results(results, args.output)
+    if args.compare:
+      comparison = bench.compare_results(results,
+        bench.load_results(args.compare), args.threshold)
+      print('Benchmark results compared with {}:'.format(args.compare))
+      bench.print_comparison(comparison)
+      if any(regressed for *_, regressed in comparison):
+        sys.exit(1)
+    else:
+      print('Benchmark results:')
+      bench.print_results(results)
+  elif args.mode == 'serve':
+    if args.socket:
+      asyncio.run(server.serve_unix(args.socket))
+    else:
+      server.serve_stdio()
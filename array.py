@@ -0,0 +1,332 @@
+import fractions
+import numbers
+import os
+import shutil
+import weakref
+
+import numpy
+
+from .core import Quantity, UnitArithmetic, Units
+
+def as_array(value):
+  return numpy.asarray(value, dtype=float)
+
+class QuantityArray:
+  # defer to the reflected operators below instead of letting NumPy treat
+  # the array as an opaque object
+  __array_ufunc__ = None
+
+  def __init__(self, value, error, units, system):
+    self.value, self.error = numpy.broadcast_arrays(
+      as_array(value), as_array(error))
+    self.units = Units(units)
+    if isinstance(system, weakref.ref):
+      self.system = system
+    else:
+      self.system = system.reference
+
+  @classmethod
+  def from_quantities(cls, quantities):
+    quantities = list(quantities)
+    if not quantities:
+      raise ValueError('no quantities given')
+    first = quantities[0]
+    if not all(isinstance(quantity, Quantity) and
+        quantity.system is first.system and quantity.units == first.units
+        for quantity in quantities):
+      raise TypeError('quantities do not have the same units and system')
+    return cls([quantity.value for quantity in quantities],
+      [quantity.error for quantity in quantities], first.units, first.system)
+
+  @property
+  def shape(self):
+    return self.value.shape
+
+  @property
+  def ndim(self):
+    return self.value.ndim
+
+  @property
+  def size(self):
+    return self.value.size
+
+  def __len__(self):
+    return len(self.value)
+
+  def __getitem__(self, key):
+    value, error = self.value[key], self.error[key]
+    if numpy.ndim(value) == 0:
+      return Quantity(float(value), float(error), self.units, self.system)
+    else:
+      return QuantityArray(value, error, self.units, self.system)
+
+  def __iter__(self):
+    for index in range(len(self)):
+      yield self[index]
+
+  def __pos__(self):
+    return QuantityArray(self.value, self.error, self.units, self.system)
+
+  def __neg__(self):
+    return QuantityArray(-self.value, self.error, self.units, self.system)
+
+  def __abs__(self):
+    return QuantityArray(abs(self.value), self.error, self.units, self.system)
+
+  def same_system(self, other):
+    return (isinstance(other, (QuantityArray, Quantity)) and
+      self.system is other.system)
+
+  @staticmethod
+  def is_number(other):
+    return isinstance(other, (numbers.Real, numpy.ndarray))
+
+  def __add__(self, other):
+    if self.same_system(other):
+      if self.units is other.units:
+        first, second = self, other
+      else:
+        first, second = self.expand(), other.expand()
+      if first.units == second.units:
+        value = first.value + as_array(second.value)
+        error = numpy.hypot(first.error, as_array(second.error))
+        return QuantityArray(value, error, first.units, first.system)
+    elif self.is_number(other):
+      first = self.expand()
+      if not first.units:
+        return QuantityArray(first.value + other, first.error, {},
+          first.system)
+    return NotImplemented
+
+  def __sub__(self, other):
+    if self.same_system(other) or self.is_number(other):
+      return self + -other
+    else:
+      return NotImplemented
+
+  def __mul__(self, other):
+    if self.same_system(other):
+      other_value, other_error = as_array(other.value), as_array(other.error)
+      value = self.value * other_value
+      error = numpy.hypot(self.error * other_value, other_error * self.value)
+      units = UnitArithmetic.multiply(self.units, other.units)
+      return QuantityArray(value, error, units, self.system)
+    elif self.is_number(other):
+      other = as_array(other)
+      value = self.value * other
+      error = abs(self.error * other)
+      return QuantityArray(value, error, self.units, self.system)
+    else:
+      return NotImplemented
+
+  def __truediv__(self, other):
+    if self.same_system(other):
+      other_value, other_error = as_array(other.value), as_array(other.error)
+      value = self.value / other_value
+      error = numpy.hypot(self.error / other_value,
+        other_error * self.value / other_value**2)
+      units = UnitArithmetic.divide(self.units, other.units)
+      return QuantityArray(value, error, units, self.system)
+    elif self.is_number(other):
+      other = as_array(other)
+      value = self.value / other
+      error = abs(self.error / other)
+      return QuantityArray(value, error, self.units, self.system)
+    else:
+      return NotImplemented
+
+  def __pow__(self, other):
+    if self.same_system(other) or isinstance(other, numpy.ndarray):
+      first = self.expand()
+      if isinstance(other, numpy.ndarray):
+        second = QuantityArray(other, 0, {}, self.system)
+      else:
+        second = other.expand()
+      if not first.units and not second.units:
+        return QuantityArray.unitless_power(first.value, first.error,
+          as_array(second.value), as_array(second.error), first.system)
+      elif (first.units and isinstance(second, Quantity) and
+          second.error == 0 and not second.units):
+        return first ** second.value
+    elif isinstance(other, numbers.Real):
+      value = self.value ** float(other)
+      with numpy.errstate(divide='ignore', invalid='ignore'):
+        error = numpy.where(self.value != 0,
+          abs(float(other) * value / self.value * self.error),
+          self.error ** float(other))
+      units = UnitArithmetic.power(self.units, other)
+      return QuantityArray(value, error, units, self.system)
+    return NotImplemented
+
+  @staticmethod
+  def unitless_power(first_value, first_error, second_value, second_error,
+      system):
+    value = first_value ** second_value
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+      error = numpy.where(first_value != 0,
+        value * numpy.hypot(second_value / first_value * first_error,
+          numpy.log(abs(first_value)) * second_error),
+        first_error ** second_value)
+    return QuantityArray(value, error, {}, system)
+
+  def __radd__(self, other):
+    if self.same_system(other) or self.is_number(other):
+      return self + other
+    else:
+      return NotImplemented
+
+  def __rsub__(self, other):
+    if self.same_system(other) or self.is_number(other):
+      return -self + other
+    else:
+      return NotImplemented
+
+  def __rmul__(self, other):
+    if self.same_system(other) or self.is_number(other):
+      return self * other
+    else:
+      return NotImplemented
+
+  def __rtruediv__(self, other):
+    if self.same_system(other) or self.is_number(other):
+      return self**-1 * other
+    else:
+      return NotImplemented
+
+  def __rpow__(self, other):
+    if self.same_system(other) or self.is_number(other):
+      second = self.expand()
+      if not second.units:
+        if self.is_number(other):
+          first_value, first_error, first_units = other, 0, {}
+        else:
+          first = other.expand()
+          first_value, first_error, first_units = (
+            first.value, first.error, first.units)
+        if not first_units:
+          return QuantityArray.unitless_power(
+            as_array(first_value), as_array(first_error),
+            second.value, second.error, second.system)
+    return NotImplemented
+
+  def expand(self):
+    factor = self.system().expand_units(self.units)
+    factor_value, factor_error = float(factor.value), float(factor.error)
+    value = self.value * factor_value
+    error = numpy.hypot(self.error * factor_value, factor_error * self.value)
+    return QuantityArray(value, error, factor.units, self.system)
+
+  def to(self, target):
+    system = self.system()
+    units = system.target_units(target)
+    factor, factor_error = system.conversion_plan(self.units, units)
+    value = self.value * factor
+    if factor_error:
+      error = numpy.hypot(self.error * factor, factor_error * self.value)
+    else:
+      error = abs(self.error * factor)
+    return QuantityArray(value, error, units, self.system)
+
+  def copy(self):
+    return QuantityArray(self.value.copy(), self.error.copy(), self.units,
+      self.system)
+
+  def __getstate__(self):
+    return self.value, self.error, self.units, self.system()
+
+  def __setstate__(self, state):
+    self.value, self.error, self.units, system = state
+    self.system = weakref.ref(system)
+
+  def __repr__(self):
+    kwargs = ', '.join('{}={}'.format(key, repr(getattr(self, key)))
+      for key in ['value', 'error', 'units', 'system'])
+    return '{}({})'.format(self.__class__.__name__, kwargs)
+
+  def __str__(self):
+    return format(self, '2s')
+
+  def __format__(self, format_spec):
+    if self.ndim == 0:
+      return format(self[()], format_spec)
+    elif self.ndim == 1:
+      return '[{}]'.format(', '.join(self.format_many(format_spec)))
+    return '[{}]'.format(', '.join(format(item, format_spec) for item in self))
+
+  def format_many(self, format_spec='', columns=False):
+    # elements are formatted in row-major order, in the same way as format()
+    # formats each of them
+    return self.system().format_values(self.value.ravel().tolist(),
+      self.error.ravel().tolist(), self.units, format_spec, columns)
+
+# arrays are saved as a directory holding the values and errors as .npy
+# files, which are memory mapped when loaded, and a header with the units and
+# the name of the system; the header is written last, so that a directory
+# without one is incomplete
+
+def save_array(array, path):
+  # imported here because the module depends on this one, and to keep the
+  # package quick to import
+  import json
+  from .snapshot import system_key
+  path = os.path.abspath(path)
+  if os.path.exists(path) and not (
+      os.path.exists(os.path.join(path, 'header.json')) or
+      os.path.isdir(path) and not os.listdir(path)):
+    raise ValueError('{} is not a saved array'.format(path))
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  # the files are written into a temporary directory, which is renamed into
+  # place, so that other processes never see a partly written array; a
+  # directory cannot replace another one atomically, so an array saved
+  # before is moved aside first
+  temporary_path = '{}.{}'.format(path, os.getpid())
+  old_path = temporary_path + '.old'
+  try:
+    os.makedirs(temporary_path)
+    numpy.save(os.path.join(temporary_path, 'value.npy'), array.value)
+    numpy.save(os.path.join(temporary_path, 'error.npy'), array.error)
+    key = system_key(array.system())
+    header = {
+      'units': [[unit, str(power) if isinstance(power, fractions.Fraction)
+        else power] for unit, power in array.units.items()],
+      'system': key[0] if key is not None else None}
+    with open(os.path.join(temporary_path, 'header.json'), 'w') as file:
+      json.dump(header, file)
+    if os.path.exists(path):
+      os.rename(path, old_path)
+    os.rename(temporary_path, path)
+  except BaseException:
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    if os.path.exists(old_path) and not os.path.exists(path):
+      os.rename(old_path, path)
+    raise
+  shutil.rmtree(old_path, ignore_errors=True)
+
+def load_array(path, system=None, mmap_mode='r'):
+  # the system defaults to the defined system of the name in the header; the
+  # values and errors are only read from the files when they are used
+  import json
+  from .snapshot import defined_systems, system_key
+  with open(os.path.join(path, 'header.json')) as file:
+    header = json.load(file)
+  if system is None:
+    if header['system'] not in defined_systems:
+      raise ValueError('array was not saved in a defined system')
+    system = defined_systems[header['system']]
+  else:
+    key = system_key(system)
+    if key is not None and header['system'] not in (None, key[0]):
+      raise ValueError('array was saved in system {}'.format(
+        header['system']))
+  units = {unit: fractions.Fraction(power) if isinstance(power, str)
+    else power for unit, power in header['units']}
+  # prefixed units are known to the system without being in its table
+  unknown = [unit for unit in units if system.unit_data(unit) is None]
+  if unknown:
+    raise ValueError('units {} are not in the system'.format(
+      ', '.join(unknown)))
+  value = numpy.load(os.path.join(path, 'value.npy'), mmap_mode=mmap_mode)
+  error = numpy.load(os.path.join(path, 'error.npy'), mmap_mode=mmap_mode)
+  if value.shape != error.shape:
+    raise ValueError('values and errors do not have the same shape')
+  return QuantityArray(value, error, units, system)
@@ -0,0 +1,137 @@
+import fractions
+import gc
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import timeit
+import tracemalloc
+
+from .core import Quantity
+from .func import atan2, exp, log, sqrt
+from .snapshot import defined_systems
+
+def scalar_benchmarks(system):
+  a = Quantity(1.5, 0.1, {'Meter': 1, 'Second': -1}, system)
+  b = Quantity(2.5, 0.2, {'Second': 1}, system)
+  c = Quantity(3.5, 0.3, {'Joule': 1}, system)
+  d = Quantity(4.5, 0.4, {'Newton': 1, 'Meter': 1}, system)
+  e = Quantity(0.5, 0.05, {}, system)
+  f = Quantity(0.7, 0.01, {}, system)
+  tesla = Quantity(1.2, 0.1, {'Tesla': 1}, system)
+  henry = Quantity(3.4, 0.2, {'Henry': 1, 'Second': -1}, system)
+  half = fractions.Fraction(1, 2)
+  return {
+    'mul': lambda: a * b,
+    'add_same_units': lambda: c + c,
+    'add_expand': lambda: c + d,
+    'pow_fraction': lambda: a ** half,
+    'expand_tesla': tesla.expand,
+    'expand_henry': henry.expand,
+    'format_s': lambda: format(c, '2s'),
+    'format_p': lambda: format(c, '2p'),
+    'str': lambda: str(d),
+    'func_sqrt': lambda: sqrt(c),
+    'func_exp': lambda: exp(e),
+    'func_log': lambda: log(e),
+    'func_atan2': lambda: atan2(e, f)}
+
+def memory_benchmarks(system, count=10000):
+  # bytes allocated for each quantity while the quantities are alive, in the
+  # same units or in distinct ones, and bytes kept for each quantity in
+  # distinct units once they are released
+  def same_units():
+    return [Quantity(i, 0, {'Meter': 1, 'Second': -1}, system)
+      for i in range(count)]
+  def distinct_units():
+    return [Quantity(1, 0, {'Meter': i + 2, 'Second': -1}, system)
+      for i in range(count)]
+  results = {}
+  tracemalloc.start()
+  try:
+    for name, make in [('same_units', same_units),
+        ('distinct_units', distinct_units)]:
+      gc.collect()
+      start = tracemalloc.get_traced_memory()[0]
+      quantities = make()
+      results['memory_{}'.format(name)] = (
+        tracemalloc.get_traced_memory()[0] - start) / count
+      del quantities
+      gc.collect()
+    results['memory_released_units'] = max(
+      tracemalloc.get_traced_memory()[0] - start, 0) / count
+  finally:
+    tracemalloc.stop()
+  return results
+
+def time_call(function, repeat):
+  timer = timeit.Timer(function)
+  number, _ = timer.autorange()
+  return min(timer.repeat(repeat, number)) / number
+
+def time_import(name, repeat):
+  # each import is timed in a new interpreter, after the package itself has
+  # been imported, so that only the system is measured
+  script = ('import time; import {0}; start = time.perf_counter(); '
+    'import {0}.{1}; print(time.perf_counter() - start)'
+    .format(__package__, name))
+  env = dict(os.environ)
+  paths = [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+  if env.get('PYTHONPATH'):
+    paths.append(env['PYTHONPATH'])
+  env['PYTHONPATH'] = os.pathsep.join(paths)
+  return min(float(subprocess.check_output([sys.executable, '-c', script],
+    env=env)) for _ in range(repeat))
+
+def run_benchmarks(repeat=5, imports=True):
+  results = {}
+  for name, function in scalar_benchmarks(defined_systems['si']).items():
+    results[name] = time_call(function, repeat)
+  results.update(memory_benchmarks(defined_systems['si']))
+  if imports:
+    for name in defined_systems:
+      results['import_{}'.format(name)] = time_import(name, repeat)
+  return {
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'results': results}
+
+def compare_results(results, baseline, threshold=0.1):
+  # gives the benchmarks in both results, with their times or sizes and
+  # whether their ratio exceeds 1 + threshold; sizes may be zero
+  comparison = []
+  for name, time in results['results'].items():
+    if name in baseline['results']:
+      old = baseline['results'][name]
+      ratio = time / old if old else 1 if not time else math.inf
+      comparison.append((name, old, time, ratio, ratio > 1 + threshold))
+  return comparison
+
+def format_result(name, result):
+  # memory benchmarks give bytes, and the others seconds
+  if name.startswith('memory_'):
+    return '{:10.1f} B '.format(result)
+  return '{:10.3f} \xb5s'.format(result * 1e6)
+
+def print_results(results):
+  width = max(len(name) for name in results['results'])
+  for name, result in results['results'].items():
+    print('  {:{width}}  {}'.format(name, format_result(name, result),
+      width=width))
+
+def print_comparison(comparison):
+  width = max(len(name) for name, *_ in comparison)
+  for name, old, new, ratio, regressed in comparison:
+    print('  {:{width}}  {}  {}  {:6.2f}x{}'.format(name,
+      format_result(name, old), format_result(name, new), ratio,
+      '  REGRESSION' if regressed else '', width=width))
+
+def save_results(results, path):
+  with open(path, 'w') as file:
+    json.dump(results, file, indent=2)
+
+def load_results(path):
+  with open(path) as file:
+    return json.load(file)
@@ -0,0 +1,98 @@
+import collections
+import math
+import os
+import re
+
+from .core import Quantity
+
+# tables of CODATA recommended values are read from files in the format of
+# the ASCII listing of NIST, https://physics.nist.gov/cuu/Constants/Table/
+# allascii.txt, whose lines after a line of dashes give the name, value,
+# uncertainty and unit of each quantity, separated by at least two spaces;
+# the rows of the 2018 listing for the quantities defined by the package are
+# bundled with it
+
+snapshot_path = os.path.join(os.path.dirname(__file__), 'codata-2018.txt')
+
+Entry = collections.namedtuple('Entry', ['value', 'error', 'units'])
+
+column_separator = re.compile(' {2,}')
+
+# names in CODATA tables of the units and constants defined by the package
+local_names = {
+  'unified atomic mass unit':          'AtomicMassUnit',
+  'Avogadro constant':                 'AvogadroConstant',
+  'electron g factor':                 'ElectronGFactor',
+  'proton g factor':                   'ProtonGFactor',
+  'neutron g factor':                  'NeutronGFactor',
+  'muon g factor':                     'MuonGFactor',
+  'speed of light in vacuum':          'LightSpeed',
+  'elementary charge':                 'ElementaryCharge',
+  'Planck constant':                   'PlanckConstant',
+  'Boltzmann constant':                'BoltzmannConstant',
+  'Newtonian constant of gravitation': 'GravitationalConstant',
+  'vacuum mag. permeability':          'VacuumPermeability',
+  'electron mass':                     'ElectronMass',
+  'proton mass':                       'ProtonMass',
+  'neutron mass':                      'NeutronMass',
+  'muon mass':                         'MuonMass'}
+
+def parse_number(string):
+  # digits are grouped by spaces, and values that are not exact decimals end
+  # with an ellipsis
+  return float(string.replace(' ', '').replace('...', ''))
+
+def read_table(path=snapshot_path):
+  # gives the entries of a table by the names of their quantities; the file
+  # is read line by line
+  table = {}
+  with open(path, encoding='ascii') as file:
+    for line in file:
+      if line.startswith('--'):
+        break
+    else:
+      raise ValueError('no table in {}'.format(path))
+    for line in file:
+      fields = column_separator.split(line.strip())
+      if len(fields) < 3:
+        continue
+      name, value, error = fields[:3]
+      table[name] = Entry(parse_number(value),
+        0.0 if error == '(exact)' else parse_number(error),
+        fields[3] if len(fields) > 3 else '')
+  return table
+
+def local_quantity(system, name):
+  # gives a constant of the system, or a unit as a quantity, or None
+  if name in system.constants:
+    return system.get_constant(name)
+  elif system.unit_data(name) is not None:
+    return Quantity(1, 0, {name: 1}, system)
+  return None
+
+def compare(system, table, rel_tol=1e-9):
+  # gives the names of the units and constants of the system whose values or
+  # errors, in the units of the table, differ from those in the table; the
+  # units of the table are those of SI
+  differences = []
+  for codata_name, name in local_names.items():
+    entry = table.get(codata_name)
+    quantity = local_quantity(system, name)
+    if entry is None or quantity is None:
+      continue
+    quantity = quantity.to(entry.units)
+    if not (math.isclose(quantity.value, entry.value, rel_tol=rel_tol) and
+        math.isclose(quantity.error, entry.error, rel_tol=rel_tol)):
+      differences.append(name)
+  return differences
+
+def update_constants(system, table):
+  # redefines the constants of the system by those in the table at once, so
+  # that constants depending on them are recomputed once; units, such as the
+  # atomic mass unit, are left as they are
+  constants = {}
+  for codata_name, entry in table.items():
+    name = local_names.get(codata_name)
+    if name in system.constants:
+      constants[name] = system.quantity(entry.value, entry.units, entry.error)
+  system.update_constants(constants)
@@ -0,0 +1,121 @@
+import math
+
+from .core import Quantity, UnitArithmetic, Units, UnitSystem
+from .snapshot import defined_systems, systems
+
+class Converter:
+  # converts quantities between two defined systems; the conversion factor of
+  # every unit of the source system is computed once, and that of every set
+  # of units is cached on first use
+  def __init__(self, from_system, to_system, through_system, units):
+    self.from_system = from_system
+    self.to_system = to_system
+    self.through_system = through_system
+    self.factors = {}
+    for unit in units:
+      self.add_factor(unit)
+    self.cache = {}
+
+  def add_factor(self, unit):
+    factor = self.from_system.expand_units({unit: 1})
+    if self.through_system is not None:
+      factor = self.through_system.expand_quantity(factor)
+    # units that cannot be expressed in the target system, such as the
+    # ampere in the Gaussian system, are left out
+    if factor.units.keys() <= self.to_system.units.keys():
+      self.factors[unit] = factor.value, factor.error, factor.units
+
+  def add_prefixed_factor(self, unit):
+    # prefixed units are converted if the units they are based on are
+    if unit in self.from_system.units:
+      return
+    data = self.from_system.unit_data(unit)
+    if data is not None:
+      if data['expansion'].units.keys() <= self.factors.keys():
+        self.add_factor(unit)
+
+  def factor(self, units):
+    try:
+      return self.cache[units]
+    except KeyError:
+      pass
+    value, relative_error, result_units = 1, 0, Units()
+    for unit, power in units.items():
+      if unit not in self.factors:
+        self.add_prefixed_factor(unit)
+      if unit not in self.factors:
+        raise TypeError('unit cannot be converted between systems: {}'
+          .format(unit))
+      unit_value, unit_error, unit_units = self.factors[unit]
+      value *= unit_value ** power
+      if unit_error:
+        relative_error = math.hypot(relative_error,
+          power * unit_error / unit_value)
+      result_units = UnitArithmetic.multiply(result_units,
+        UnitArithmetic.power(unit_units, power))
+    result = self.cache[units] = (
+      float(value), float(abs(value) * relative_error), result_units)
+    return result
+
+  def convert(self, quantity):
+    value, error, units = self.factor(quantity.units)
+    if isinstance(quantity, Quantity):
+      hypot = math.hypot
+    else:
+      # quantity arrays are converted with a single multiplication
+      import numpy
+      hypot = numpy.hypot
+    return type(quantity)(quantity.value * value,
+      hypot(quantity.error * value, error * quantity.value), units,
+      self.to_system)
+
+converters = {}
+
+def system_name(system):
+  # only systems that have been loaded can be the system of a quantity
+  for name in defined_systems:
+    if systems.loaded.get(name) is system:
+      return name
+  raise TypeError('system is not one of the defined systems')
+
+def get_converter(from_name, to_name, through=None):
+  key = from_name, to_name, through
+  try:
+    return converters[key]
+  except KeyError:
+    pass
+  from_system = defined_systems[from_name]
+  to_system = defined_systems[to_name]
+  # conversions are made in the same way as the definitions of the CGS-based
+  # systems were translated from SI; in the Gaussian system, the ampere is
+  # converted as in either the ESU or the EMU system if requested, and the
+  # CGS-based systems have no base unit of electric current, so only their
+  # mechanical units can be converted
+  if from_name == 'si':
+    if to_name == 'gauss' and through is not None:
+      to_name = through
+    through_system = systems[{'cgs': 'si_to_cgs', 'esu': 'si_to_esu',
+      'emu': 'si_to_emu', 'gauss': 'si_to_cgs'}[to_name]]
+    units = from_system.units
+  else:
+    through_system = systems['cgs_to_si'] if to_name == 'si' else None
+    units = from_system.units.keys() & defined_systems['cgs'].units.keys()
+  result = converters[key] = Converter(
+    from_system, to_system, through_system, units)
+  return result
+
+def convert(quantity, to_system, through=None):
+  if isinstance(to_system, UnitSystem):
+    to_name = system_name(to_system)
+  else:
+    to_name = to_system
+  from_name = system_name(quantity.system())
+  if through not in [None, 'esu', 'emu']:
+    raise ValueError('invalid system for converting the ampere')
+  # the ampere is only converted from SI into the Gaussian system
+  if through is not None and (from_name, to_name) != ('si', 'gauss'):
+    raise ValueError('the ampere is only converted through another system '
+      'from si to gauss')
+  if from_name == to_name:
+    return +quantity
+  return get_converter(from_name, to_name, through).convert(quantity)
@@ -1,33 +1,147 @@
+import collections
+import collections.abc
 import copy
 import fractions
 import functools
 import math
 import numbers
+import operator
 import re
 import sys
+import threading
+import unicodedata
 import weakref
 
+class Units(collections.abc.Mapping):
+  # immutable mapping from units to powers; instances are interned, so that
+  # all quantities with the same units share a single object
+  __slots__ = ['data', 'key', 'hash_value', '__weakref__']
+  # instances are only kept while they are used, so that programs seeing
+  # many distinct units, e.g. when reading data, do not keep them all
+  interned = weakref.WeakValueDictionary()
+
+  def __new__(cls, units=()):
+    if type(units) is cls:
+      return units
+    data = dict(units)
+    # powers of different types may compare equal but are displayed
+    # differently, e.g. 0.5 and fractions.Fraction(1, 2); fractions are keyed
+    # by their integers, since the interned units are removed as they are
+    # released, which may happen at exit after the fractions module is gone
+    key = frozenset([(unit, type(power), (power.numerator, power.denominator)
+      if type(power) is fractions.Fraction else power)
+      for unit, power in data.items()])
+    try:
+      return cls.interned[key]
+    except KeyError:
+      self = super().__new__(cls)
+      self.data = data
+      self.key = key
+      self.hash_value = hash(frozenset(data.items()))
+      return cls.interned.setdefault(key, self)
+
+  def __getitem__(self, unit):
+    return self.data[unit]
+
+  def __iter__(self):
+    return iter(self.data)
+
+  def __len__(self):
+    return len(self.data)
+
+  def __contains__(self, unit):
+    return unit in self.data
+
+  def keys(self):
+    return self.data.keys()
+
+  def items(self):
+    return self.data.items()
+
+  def values(self):
+    return self.data.values()
+
+  def get(self, unit, default=None):
+    return self.data.get(unit, default)
+
+  def __eq__(self, other):
+    if self is other:
+      return True
+    elif isinstance(other, Units):
+      return self.data == other.data
+    elif isinstance(other, collections.abc.Mapping):
+      return self.data == dict(other)
+    else:
+      return NotImplemented
+
+  def __hash__(self):
+    return self.hash_value
+
+  def __repr__(self):
+    return repr(self.data)
+
+  def __reduce__(self):
+    return (Units, (self.data,))
+
+  def copy(self):
+    return self
+
+  def __copy__(self):
+    return self
+
+  def __deepcopy__(self, memo):
+    return self
+
 class UnitArithmetic:
+  # results are memoized by the keys of the interned operands; the caches
+  # are simply emptied if unusual programs fill them up
+  cache_size = 4096
+  multiply_cache = {}
+  divide_cache = {}
+  power_cache = {}
+
   @classmethod
   def multiply(cls, first, second):
-    result = first.copy()
-    for unit, power in second.items():
-      result[unit] = result.get(unit, 0) + power
-    return cls.clean(result)
+    first, second = Units(first), Units(second)
+    key = first.key, second.key
+    try:
+      return cls.multiply_cache[key]
+    except KeyError:
+      result = dict(first)
+      for unit, power in second.items():
+        result[unit] = result.get(unit, 0) + power
+      return cls.remember(cls.multiply_cache, key, cls.clean(result))
 
   @classmethod
   def divide(cls, first, second):
-    result = first.copy()
-    for unit, power in second.items():
-      result[unit] = result.get(unit, 0) - power
-    return cls.clean(result)
+    first, second = Units(first), Units(second)
+    key = first.key, second.key
+    try:
+      return cls.divide_cache[key]
+    except KeyError:
+      result = dict(first)
+      for unit, power in second.items():
+        result[unit] = result.get(unit, 0) - power
+      return cls.remember(cls.divide_cache, key, cls.clean(result))
 
   @classmethod
   def power(cls, units, other):
     if other == 0:
-      return {}
-    else:
-      return cls.clean({unit: power * other for unit, power in units.items()})
+      return Units()
+    units = Units(units)
+    key = units.key, type(other), other
+    try:
+      return cls.power_cache[key]
+    except KeyError:
+      return cls.remember(cls.power_cache, key, cls.clean(
+        {unit: power * other for unit, power in units.items()}))
+
+  @classmethod
+  def remember(cls, cache, key, units):
+    if len(cache) >= cls.cache_size:
+      cache.clear()
+    result = cache[key] = Units(units)
+    return result
 
   @staticmethod
   def clean(units):
@@ -51,12 +165,202 @@ class UnitArithmetic:
           result[unit] = power
     return result
 
+# characters in symbols that are spelled out in the names of variables
+symbol_to_english = {
+  '\u03b1': 'alpha',    '\u03b2': 'beta',     '\u03b3': 'gamma',
+  '\u03b4': 'delta',    '\u03b5': 'epsilon',  '\u03b6': 'zeta',
+  '\u03b7': 'eta',      '\u03b8': 'theta',    '\u03b9': 'iota',
+  '\u03ba': 'kappa',    '\u03bb': 'lambda',   '\u03bc': 'mu',
+  '\u03bd': 'nu',       '\u03be': 'xi',       '\u03bf': 'omicron',
+  '\u03c0': 'pi',       '\u03c1': 'rho',      '\u03c3': 'sigma',
+  '\u03c4': 'tau',      '\u03c5': 'upsilon',  '\u03c6': 'phi',
+  '\u03c7': 'chi',      '\u03c8': 'psi',      '\u03c9': 'omega',
+  '\xb0':   'deg',      "'":      'arcmin',   '"':      'arcsec',
+  '\u0127': 'hbar',     '\u2126': 'Ohm',      '\u212b': 'angstrom'
+}
+
+# prefixes of units, with their names and the powers of ten they stand for;
+# 'u' may be written for the micro sign
+prefixes = {
+  'Q': ('Quetta', 30),  'R': ('Ronna', 27),   'Y': ('Yotta', 24),
+  'Z': ('Zetta', 21),   'E': ('Exa', 18),     'P': ('Peta', 15),
+  'T': ('Tera', 12),    'G': ('Giga', 9),     'M': ('Mega', 6),
+  'k': ('Kilo', 3),     'h': ('Hecto', 2),    'da': ('Deca', 1),
+  'd': ('Deci', -1),    'c': ('Centi', -2),   'm': ('Milli', -3),
+  '\u03bc': ('Micro', -6), 'u': ('Micro', -6), 'n': ('Nano', -9),
+  'p': ('Pico', -12),   'f': ('Femto', -15),  'a': ('Atto', -18),
+  'z': ('Zepto', -21),  'y': ('Yocto', -24),  'r': ('Ronto', -27),
+  'q': ('Quecto', -30)}
+
+prefix_names = {}
+for symbol, (name, exponent) in prefixes.items():
+  prefix_names.setdefault(name, (symbol, exponent))
+
+def english_name(symbol):
+  for character, english in symbol_to_english.items():
+    symbol = symbol.replace(character, english)
+  return symbol
+
+units_token_pattern = re.compile(
+  r'\s*(?:(\*\*|[*/^()\xb7])|([-+]?\d+(?:\.\d+)?)|([^\s*/^()\xb7]+))')
+
+class UnitsParser:
+  # parses expressions such as 'kg m s^-2', 'J/(mol K)' and 'm^(1/2)';
+  # juxtaposed units are multiplied, and a division applies only to the
+  # factor following it, so that 'J/mol K' is 'J K/mol'
+  def __init__(self, lookup, string):
+    # lookup gives the unit for a symbol, or None
+    self.lookup = lookup
+    self.string = string
+    self.tokens = []
+    position = 0
+    string = string.rstrip()
+    while position < len(string):
+      match = units_token_pattern.match(string, position)
+      if match is None:
+        self.error()
+      self.tokens.append(match.groups())
+      position = match.end()
+    self.position = 0
+
+  def error(self):
+    raise ValueError('invalid units {!r}'.format(self.string))
+
+  def peek(self):
+    if self.position < len(self.tokens):
+      return self.tokens[self.position]
+    return None, None, None
+
+  def next(self):
+    result = self.peek()
+    self.position += 1
+    return result
+
+  def parse(self):
+    if not self.tokens:
+      return Units()
+    result = self.expression()
+    if self.position != len(self.tokens):
+      self.error()
+    return result
+
+  def expression(self):
+    result = self.factor()
+    while self.position < len(self.tokens):
+      punctuation, _, _ = self.peek()
+      if punctuation == ')':
+        break
+      elif punctuation == '/':
+        self.next()
+        result = UnitArithmetic.divide(result, self.factor())
+      else:
+        if punctuation in ('*', '\xb7'):
+          self.next()
+        result = UnitArithmetic.multiply(result, self.factor())
+    return result
+
+  def factor(self):
+    result = self.atom()
+    if self.peek()[0] in ('^', '**'):
+      self.next()
+      result = UnitArithmetic.power(result, self.exponent())
+    return result
+
+  def atom(self):
+    punctuation, number, name = self.next()
+    if punctuation == '(':
+      result = self.expression()
+      if self.next()[0] != ')':
+        self.error()
+      return result
+    elif number == '1':
+      return Units()
+    elif name is not None:
+      unit = self.lookup(name)
+      if unit is None:
+        raise ValueError('unknown unit {}'.format(name))
+      return Units({unit: 1})
+    self.error()
+
+  def exponent(self):
+    punctuation, number, _ = self.next()
+    if punctuation == '(':
+      punctuation, number, _ = self.next()
+      if number is None:
+        self.error()
+      if self.peek()[0] == '/':
+        self.next()
+        _, denominator, _ = self.next()
+        if denominator is None:
+          self.error()
+        number = '{}/{}'.format(number, denominator)
+      if self.next()[0] != ')':
+        self.error()
+    elif number is None:
+      self.error()
+    result = fractions.Fraction(number)
+    return result.numerator if result.denominator == 1 else result
+
+# constants and units can be defined by a factor times a product of powers of
+# constants, so that they are recomputed when those constants are updated; the
+# factor is a number, or the value, error and units of a quantity
+Definition = collections.namedtuple('Definition', ['factor', 'constants'],
+  defaults=[{}])
+
+def definition_order(dependencies):
+  # orders names after the names they depend on, and otherwise as given;
+  # only the names mapped to their dependencies are given in the result
+  order, visited, active = [], set(), set()
+  for name in dependencies:
+    stack = [(name, False)]
+    while stack:
+      name, finished = stack.pop()
+      if finished:
+        active.remove(name)
+        order.append(name)
+      elif name in active:
+        raise ValueError('definition of {} depends on itself'.format(name))
+      elif name not in visited and name in dependencies:
+        visited.add(name)
+        active.add(name)
+        stack.append((name, True))
+        stack.extend((dependency, False)
+          for dependency in reversed(list(dependencies[name])))
+  return order
+
+# protects the base units, their indices and the dimensions of a system,
+# which gain units unknown to the system as new base units, and its cache of
+# prefixed units, as well as copies of a system taken meanwhile; it is
+# reentrant, as generating a prefixed unit may add base units; other caches
+# only gain values that any thread would compute in the same way
+dimension_lock = threading.RLock()
+
+CacheInfo = collections.namedtuple('CacheInfo', ['hits', 'misses', 'currsize'])
+
 class UnitSystem:
-  def __init__(self):
+  def __init__(self, correlated=False):
     self.units = {}
     self.constants = {}
+    # constants and units of correlated systems depend on independent
+    # variables for their definitions with errors
+    self.correlated = correlated
+    self.frozen = False
+    # definitions of constants and units in terms of constants
+    self.constant_definitions = {}
+    self.unit_definitions = {}
+    # shared by all quantities in this system
+    self.reference = weakref.ref(self)
+    self.clear_translations()
+    self.clear_dimensions()
+    self.cache_clear()
 
-  def add_unit(self, unit, symbol, expansion=None):
+  def add_unit(self, unit, symbol, expansion=None, prefixable=False):
+    # only units marked as prefixable are given prefixes, such as SI units
+    if self.frozen:
+      raise TypeError('system is frozen')
+    definition = expansion if isinstance(expansion, Definition) else None
+    if definition is not None:
+      expansion = self.evaluate_definition(definition)
     valid = (
       expansion is None or
       isinstance(expansion, numbers.Real) or
@@ -64,23 +368,281 @@ class UnitSystem:
     if not valid:
       raise TypeError('unit expansion is not in terms of system units')
     if isinstance(expansion, Quantity):
-      expansion = expansion.expand()
-    self.units[unit] = {'symbol': symbol, 'expansion': expansion}
+      expansion = self.correlated_definition(expansion, unit).expand()
+    self.units[unit] = {'symbol': symbol, 'expansion': expansion,
+      'prefixable': prefixable}
+    self.set_definition(self.unit_definitions, unit, definition)
+    if unit in self.base_index and expansion is not None:
+      # a base unit has been redefined, so existing vectors are invalid
+      self.clear_dimensions()
+      for unit, data in self.units.items():
+        self.add_dimension(unit, data['expansion'])
+    else:
+      self.add_dimension(unit, expansion)
+    self.cache_clear()
 
   def add_constant(self, constant, symbol, definition):
+    if self.frozen:
+      raise TypeError('system is frozen')
+    recorded = definition if isinstance(definition, Definition) else None
+    if recorded is not None:
+      definition = self.evaluate_definition(recorded)
     valid = (
       isinstance(definition, numbers.Real) or
       (isinstance(definition, Quantity) and definition.system() is self))
     if not valid:
       raise TypeError('constant definition is not in terms of system units')
     if isinstance(definition, Quantity):
-      definition = definition.expand()
+      definition = self.correlated_definition(definition, constant).expand()
     self.constants[constant] = {'symbol': symbol, 'definition': definition}
+    self.set_definition(self.constant_definitions, constant, recorded)
+    self.cache_clear()
+
+  def add_constants(self, constants):
+    # constants are given by their names mapped to their symbols and
+    # definitions, and are added after the constants their definitions use
+    dependencies = {constant: definition.constants
+      if isinstance(definition, Definition) else {}
+      for constant, (_, definition) in constants.items()}
+    for constant in definition_order(dependencies):
+      self.add_constant(constant, *constants[constant])
+
+  def evaluate_definition(self, definition):
+    factor = definition.factor
+    if isinstance(factor, tuple):
+      factor = Quantity(*factor, self)
+    if not definition.constants:
+      return factor
+    return factor * self.get_constant(definition.constants)
+
+  def set_definition(self, definitions, name, definition):
+    # a unit or constant given by its value is no longer recomputed, nor
+    # translated from another system
+    if definition is None:
+      definitions.pop(name, None)
+    else:
+      definitions[name] = definition
+    self.sources.pop(name, None)
+
+  def update_constant(self, constant, definition):
+    self.update_constants({constant: definition})
+
+  def update_constants(self, constants):
+    # constants are redefined by quantities or definitions, and the constants
+    # and units defined in terms of them are recomputed once, both here and
+    # in systems translating them
+    if self.frozen:
+      raise TypeError('system is frozen')
+    for constant in constants:
+      if constant not in self.constants:
+        raise ValueError('unknown constant {}'.format(constant))
+    # the new definitions must not depend on the constants themselves
+    dependencies = {constant: definition.constants
+      for constant, definition in self.constant_definitions.items()}
+    dependencies.update((constant, definition.constants
+      if isinstance(definition, Definition) else {})
+      for constant, definition in constants.items())
+    for constant in definition_order(dependencies):
+      if constant in constants:
+        self.add_constant(constant, self.constants[constant]['symbol'],
+          constants[constant])
+    self.recompute(constants)
+
+  def recompute(self, changed):
+    # constants are recomputed after the constants their definitions use
+    changed = set(changed)
+    dependencies = {constant: definition.constants
+      for constant, definition in self.constant_definitions.items()}
+    for constant in definition_order(dependencies):
+      if constant not in changed and not changed.isdisjoint(
+          dependencies[constant]):
+        changed.add(constant)
+        self.add_constant(constant, self.constants[constant]['symbol'],
+          self.constant_definitions[constant])
+    for unit, definition in list(self.unit_definitions.items()):
+      if not changed.isdisjoint(definition.constants):
+        changed.add(unit)
+        self.add_unit(unit, self.units[unit]['symbol'], definition,
+          self.units[unit]['prefixable'])
+    for system in list(self.derived_systems):
+      system.retranslate(self, changed)
+
+  def clear_translations(self):
+    # units and constants translated from other systems are mapped to those
+    # systems and the systems they were expanded in, and systems are known
+    # to those translating from them, so that updates are translated too
+    self.sources = {}
+    self.derived_systems = weakref.WeakSet()
 
-  def get_constant(self, arg):
+  def translate(self, source, name, through_system):
+    # a unit or constant of another system is expanded in a system giving its
+    # units in terms of those of this one
+    if name in source.constants:
+      data = source.constants[name]
+      quantity = data['definition']
+    else:
+      data = source.units[name]
+      quantity = data['expansion']
+    if isinstance(quantity, Quantity):
+      quantity = through_system.expand_quantity(quantity.expand())
+      quantity.system = self.reference
+    if name in source.constants:
+      self.add_constant(name, data['symbol'], quantity)
+    else:
+      self.add_unit(name, data['symbol'], quantity, data['prefixable'])
+    self.sources[name] = source.reference, through_system
+    source.derived_systems.add(self)
+
+  def retranslate(self, source, changed):
+    translated = [name for name in changed
+      if self.sources.get(name, (None,))[0] is source.reference]
+    for name in translated:
+      self.translate(source, name, self.sources[name][1])
+    if translated:
+      self.recompute(translated)
+
+  def freeze(self):
+    # frozen systems cannot be changed, so that they can be shared between
+    # threads; copies of them can be changed
+    self.unit_symbols()
+    self.frozen = True
+
+  def unit_symbols(self):
+    # maps the names of units, their symbols and the names of variables
+    # for them to the units, with symbols taking precedence
+    if self.unit_symbol_table is None:
+      table = {unit: unit for unit in self.units}
+      table.update((english_name(data['symbol']), unit)
+        for unit, data in self.units.items())
+      table.update((unicodedata.normalize('NFKC', data['symbol']), unit)
+        for unit, data in self.units.items())
+      table.update((data['symbol'], unit) for unit, data in self.units.items())
+      self.unit_symbol_table = table
+    return self.unit_symbol_table
+
+  def unit_for_symbol(self, symbol):
+    # symbols may also be written with compatible characters, such as the
+    # letter omega for the ohm sign, and with prefixes
+    symbols = self.unit_symbols()
+    unit = symbols.get(symbol)
+    if unit is None:
+      symbol = unicodedata.normalize('NFKC', symbol)
+      unit = symbols.get(symbol)
+      if unit is None:
+        unit = self.prefixed_symbol(symbol)
+    return unit
+
+  def prefix_base(self, symbol):
+    # gives the prefixable unit to which a prefix can be applied, its name
+    # and symbol without a prefix, and the power of ten of its value in terms
+    # of the unit; grams can be prefixed in systems with only kilograms
+    unit = self.unit_symbols().get(symbol)
+    if unit is not None:
+      if self.units[unit]['prefixable']:
+        return unit, unit.lower(), self.units[unit]['symbol'], 0
+    elif symbol == 'g' and 'Kilogram' in self.units:
+      return 'Kilogram', 'gram', 'g', -3
+    return None
+
+  def prefixed_symbol(self, symbol):
+    # symbols that can be read as prefixed units in several ways are
+    # ambiguous, and are not read as any
+    candidates = []
+    for prefix in prefixes:
+      if symbol.startswith(prefix) and len(symbol) > len(prefix):
+        base = self.prefix_base(symbol[len(prefix):])
+        if base is not None:
+          candidates.append((prefix, base))
+    if len(candidates) != 1:
+      return None
+    return self.add_prefixed_unit(*candidates[0])
+
+  def prefixed_name(self, name):
+    for prefix_name, (prefix, _) in prefix_names.items():
+      if name.startswith(prefix_name):
+        base_name = name[len(prefix_name):]
+        for unit, data in self.units.items():
+          if unit.lower() == base_name and data['prefixable']:
+            return self.add_prefixed_unit(prefix,
+              (unit, base_name, data['symbol'], 0))
+        if base_name == 'gram':
+          base = self.prefix_base('g')
+          if base is not None:
+            return self.add_prefixed_unit(prefix, base)
+    return None
+
+  def add_prefixed_unit(self, prefix, base):
+    # prefixed units are named by the prefix and the unit, e.g. Kilometer;
+    # they are kept in a cache rather than in the tables of units, so that
+    # frozen systems are left unchanged, and are generated again when the
+    # units they are based on change
+    unit, base_name, base_symbol, offset = base
+    prefix_name, exponent = prefixes[prefix]
+    name = prefix_name + base_name
+    if name in self.units or name in self.prefixed_units:
+      return name
+    with dimension_lock:
+      if name not in self.prefixed_units:
+        expansion = Quantity(float('1e{}'.format(exponent + offset)), 0,
+          {unit: 1}, self)
+        self.prefixed_units[name] = {
+          'symbol': prefix_names[prefix_name][0] + base_symbol,
+          'expansion': expansion, 'prefixable': False,
+          'dimension': self.dimension_of(name, expansion)}
+    return name
+
+  def unit_data(self, unit):
+    # gives the symbol and expansion of a unit, or None if it is unknown
+    data = self.units.get(unit)
+    if data is None:
+      data = self.prefixed_units.get(unit)
+      if data is None and self.prefixed_name(unit) is not None:
+        data = self.prefixed_units[unit]
+    return data
+
+  def parse_units(self, string):
+    try:
+      return self.units_parse_cache[string]
+    except KeyError:
+      pass
+    if len(self.units_parse_cache) >= UnitArithmetic.cache_size:
+      self.units_parse_cache.clear()
+    result = self.units_parse_cache[string] = UnitsParser(
+      self.unit_for_symbol, string).parse()
+    return result
+
+  def quantity(self, value, units=None, error=0):
+    # a string is parsed as a formatted quantity, with its error and units
+    if isinstance(value, str):
+      if units is not None:
+        raise TypeError('units are given both in the string and separately')
+      # imported here because the module depends on this one
+      from .reader import parse_values
+      value, error, units = parse_values(value)
+    return Quantity(value, error, self.parse_units(units or ''), self)
+
+  def compile(self, function, inputs):
+    # imported here because the module depends on this one
+    from .formula import Formula
+    return Formula(self, function, inputs)
+
+  def correlated_definition(self, definition, name):
+    if not self.correlated or type(definition) is not Quantity:
+      return definition
+    # imported here because the module depends on this one
+    from .correlated import Correlated
+    return Correlated.from_quantity(definition, name)
+
+  def get_constant(self, arg, correlated=False):
+    if correlated and not self.correlated:
+      # constants are taken from a correlated system defined in the same way
+      from .correlated import Correlated
+      from .snapshot import correlated_system
+      result = correlated_system(self).get_constant(arg, correlated)
+      return Correlated(result.value, result.gradient, result.units, self)
     if isinstance(arg, dict):
       # argument is a dictionary of constants and their powers
-      return functools.reduce(Quantity.__mul__,
+      return functools.reduce(operator.mul,
         (self.constants[constant]['definition'] ** power
           for constant, power in arg.items()))
     else:
@@ -88,24 +650,137 @@ class UnitSystem:
       return self.constants[arg]['definition']
 
   def expand_quantity(self, quantity):
-    return (Quantity(quantity.value, quantity.error, {}, self) *
-      self.expand_units(quantity.units))
+    if type(quantity) is not Quantity:
+      # quantities of other kinds, such as correlated ones, expand themselves
+      return quantity.expand_in(self)
+    factor = self.expand_units(quantity.units)
+    value = quantity.value * factor.value
+    error = math.hypot(quantity.error * factor.value,
+      factor.error * quantity.value)
+    return Quantity(value, error, factor.units, self)
+
+  def target_units(self, target):
+    # targets of conversions are unit strings, mappings of units or unit
+    # quantities of the system
+    if isinstance(target, str):
+      return self.parse_units(target)
+    elif isinstance(target, Quantity):
+      if target.system is not self.reference:
+        raise TypeError('target is not in terms of system units')
+      if target.value != 1 or target.error != 0:
+        raise ValueError('target is not a unit')
+      return target.units
+    elif isinstance(target, collections.abc.Mapping):
+      return Units(target)
+    raise TypeError('target is not a unit')
+
+  def conversion_plan(self, units, target_units):
+    # gives the factor converting values in the units to values in the target
+    # units, together with its error
+    key = units, target_units
+    try:
+      return self.conversion_cache[key]
+    except KeyError:
+      pass
+    source, target = self.expand_units(units), self.expand_units(target_units)
+    if source.units != target.units:
+      raise TypeError('units cannot be converted to {}'.format(
+        self.format_units(target_units)))
+    factor = source.value / target.value
+    error = math.hypot(source.error / target.value,
+      target.error * factor / target.value)
+    if len(self.conversion_cache) >= UnitArithmetic.cache_size:
+      self.conversion_cache.clear()
+    result = self.conversion_cache[key] = factor, error
+    return result
 
   def expand_units(self, units):
-    if not units:
-      return Quantity(1, 0, {}, self)
-    units = list(units.items())
-    expansions = []
-    while units:
-      unit, power = units.pop()
-      expansion = self.units.get(unit, {'expansion': None})['expansion']
-      if expansion is None:
-        expansions.append(Quantity(1, 0, {unit: power}, self))
-      else:
-        temp = expansion ** power
-        units += list(temp.units.items())
-        expansions.append(Quantity(temp.value, temp.error, {}, self))
-    return functools.reduce(Quantity.__mul__, expansions)
+    # the result is shared between callers and must not be modified; the
+    # powers of the result have the types of those of the units
+    units = Units(units)
+    try:
+      result = self.expansion_cache[units.key]
+    except KeyError:
+      self.cache_misses += 1
+      result = self.expansion_cache[units.key] = self.compute_expansion(units)
+    else:
+      self.cache_hits += 1
+    return result
+
+  def clear_dimensions(self):
+    # base units are given fixed indices, and every unit is described by a
+    # vector of exponents of base units together with a scale factor and its
+    # error; vectors may be shorter than the number of base units, in which
+    # case the missing exponents are zero
+    self.base_units = []
+    self.base_index = {}
+    self.dimensions = {}
+
+  def add_dimension(self, unit, expansion):
+    self.dimensions[unit] = self.dimension_of(unit, expansion)
+
+  def dimension_of(self, unit, expansion):
+    if expansion is None:
+      return (self.base_vector(unit), 1, 0)
+    elif isinstance(expansion, Quantity):
+      # expansions are normally in terms of base units already, in which case
+      # the scale is unity
+      scale = self.compute_expansion(expansion.units)
+      return (self.dimension(expansion.units),
+        expansion.value * scale.value,
+        math.hypot(expansion.error * scale.value,
+          scale.error * expansion.value))
+    else:
+      return ((), expansion, 0)
+
+  def base_vector(self, unit):
+    if unit not in self.base_index:
+      self.base_index[unit] = len(self.base_units)
+      self.base_units.append(unit)
+    index = self.base_index[unit]
+    return (0,) * index + (1,)
+
+  def dimension_entry(self, unit):
+    try:
+      return self.dimensions[unit]
+    except KeyError:
+      pass
+    data = self.prefixed_units.get(unit)
+    if data is None and self.prefixed_name(unit) is not None:
+      data = self.prefixed_units[unit]
+    if data is not None:
+      return data['dimension']
+    # units unknown to the system are treated as base units
+    with dimension_lock:
+      result = self.dimensions.get(unit)
+      if result is None:
+        result = self.dimensions[unit] = (self.base_vector(unit), 1, 0)
+    return result
+
+  def dimension(self, units):
+    # other threads may add base units meanwhile, so the result is long
+    # enough for the vectors as well as the base units
+    vectors = [(self.dimension_entry(unit)[0], power)
+      for unit, power in units.items()]
+    result = [0] * max([len(self.base_units)] +
+      [len(vector) for vector, _ in vectors])
+    for vector, power in vectors:
+      for index, exponent in enumerate(vector):
+        if exponent:
+          result[index] += exponent * power
+    return tuple(result)
+
+  def compute_expansion(self, units):
+    value, relative_error = 1, 0
+    for unit, power in units.items():
+      _, unit_value, unit_error = self.dimension_entry(unit)
+      value *= unit_value ** power
+      if unit_error:
+        relative_error = math.hypot(relative_error,
+          power * unit_error / unit_value)
+    units = UnitArithmetic.clean({self.base_units[index]: power
+      for index, power in enumerate(self.dimension(units)) if power})
+    return Quantity(value, abs(value) * relative_error, units, self)
 
   def format_quantity(self, quantity, format_spec):
     if quantity.units:
@@ -123,8 +798,43 @@ class UnitSystem:
         return self.format_value_error(
           quantity.value, quantity.error, format_spec)
 
+  def format_many(self, quantities, format_spec='', columns=False):
+    # formats quantities in the same way as format(), but parses the format
+    # specifier only once; if columns is true, pairs of the value and error,
+    # and the units, are generated instead
+    error_sigfig, mode = self.parse_format_spec(format_spec)
+    for quantity in quantities:
+      if quantity.system is not self.reference:
+        raise TypeError('quantity is not in terms of system units')
+      yield self.format_item(quantity.value, quantity.error,
+        self.format_units(quantity.units), error_sigfig, mode, columns)
+
+  def format_values(self, values, errors, units, format_spec='',
+      columns=False):
+    error_sigfig, mode = self.parse_format_spec(format_spec)
+    units_string = self.format_units(units)
+    for value, error in zip(values, errors):
+      yield self.format_item(value, error, units_string, error_sigfig, mode,
+        columns)
+
+  @classmethod
+  def format_item(cls, value, error, units_string, error_sigfig, mode,
+      columns):
+    if error == 0:
+      value_error_string = str(value)
+    else:
+      value_error_string = cls.format_parsed_value_error(value, error,
+        error_sigfig, mode, parens=bool(units_string) and not columns)
+    if columns:
+      return value_error_string, units_string
+    elif units_string:
+      return '{} {}'.format(value_error_string, units_string)
+    else:
+      return value_error_string
+
   @staticmethod
-  def format_value_error(value, error, format_spec, parens=False):
+  @functools.lru_cache(maxsize=None)
+  def parse_format_spec(format_spec):
     # options: number of significant digits displayed for error
     #          separate value and error ('s') or parenthesize error ('p')
     match = re.fullmatch(r'(\d+)?([sp])?', format_spec)
@@ -139,6 +849,17 @@ class UnitSystem:
     temp = match.group(2)
     if temp is not None:
       mode = temp
+    return error_sigfig, mode
+
+  @classmethod
+  def format_value_error(cls, value, error, format_spec, parens=False):
+    error_sigfig, mode = cls.parse_format_spec(format_spec)
+    return cls.format_parsed_value_error(value, error, error_sigfig, mode,
+      parens)
+
+  @staticmethod
+  def format_parsed_value_error(value, error, error_sigfig, mode,
+      parens=False):
     if not math.isfinite(value) or not math.isfinite(error):
       if mode == 's':
         result = '{} \xb1 {}'.format(value, error)
@@ -181,12 +902,21 @@ class UnitSystem:
         return '{:.{dp}f}({})e{}'.format(temp1, temp2, formatted_head, dp=dp)
 
   def format_units(self, units):
-    return ' '.join(self.format_unit(unit, power)
-      for unit, power in sorted(units.items(),
+    # keyed by the types of the powers as well, which are displayed
+    # differently
+    units = Units(units)
+    try:
+      return self.units_string_cache[units.key]
+    except KeyError:
+      pass
+    result = self.units_string_cache[units.key] = ' '.join(
+      self.format_unit(unit, power) for unit, power in sorted(units.items(),
       key=lambda arg: (math.copysign(1, -arg[1]), arg[0])))
+    return result
 
   def format_unit(self, unit, power):
-    symbol = self.units.get(unit, {'symbol': unit})['symbol']
+    data = self.unit_data(unit)
+    symbol = data['symbol'] if data is not None else unit
     if power == 1:
       return symbol
     elif power < 0 or isinstance(power, fractions.Fraction):
@@ -194,26 +924,88 @@ class UnitSystem:
     else:
       return '{}^{}'.format(symbol, power)
 
+  def cache_info(self):
+    return CacheInfo(self.cache_hits, self.cache_misses,
+      len(self.expansion_cache))
+
+  def stats(self):
+    # imported here because the module depends on this one
+    from .instrument import stats
+    return stats(self)
+
+  def cache_clear(self):
+    self.expansion_cache = {}
+    self.units_string_cache = {}
+    self.units_parse_cache = {}
+    self.conversion_cache = {}
+    self.unit_symbol_table = None
+    # units with prefixes, which are only generated when first used
+    self.prefixed_units = {}
+    self.cache_hits = 0
+    self.cache_misses = 0
+
+  def __getstate__(self):
+    # weak references cannot be pickled, and the caches are rebuilt on use
+    state = self.__dict__.copy()
+    # other systems are not saved with this one, so translations from them are
+    # no longer updated
+    for key in ['reference', 'expansion_cache', 'units_string_cache',
+        'units_parse_cache', 'conversion_cache', 'unit_symbol_table',
+        'prefixed_units', 'cache_hits', 'cache_misses', 'sources',
+        'derived_systems']:
+      del state[key]
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self.reference = weakref.ref(self)
+    self.clear_translations()
+    self.cache_clear()
+
+  def __reduce_ex__(self, protocol):
+    # systems built by the package are pickled by name, and are unpickled as
+    # the systems of the same name in the unpickling process; other systems
+    # are pickled by value
+    # imported here because the module depends on this one
+    from .snapshot import get_system, system_key
+    key = system_key(self)
+    if key is None:
+      return super().__reduce_ex__(protocol)
+    return get_system, key
+
+  def __deepcopy__(self, memo):
+    # systems are always copied by value
+    result = object.__new__(type(self))
+    memo[id(self)] = result
+    result.__setstate__(copy.deepcopy(self.__getstate__(), memo))
+    return result
+
   def copy(self):
-    result = copy.deepcopy(self)
+    with dimension_lock:
+      result = copy.deepcopy(self)
+    result.frozen = False
     # copy.deepcopy updates the circular reference automatically, but not
     # circular weak references
+    result.reference = weakref.ref(result)
     for data in result.units.values():
-      if data['expansion'] is not None:
-        data['expansion'].system = weakref.ref(result)
+      if isinstance(data['expansion'], Quantity):
+        data['expansion'].system = result.reference
     for data in result.constants.values():
-      data['definition'].system = weakref.ref(result)
+      if isinstance(data['definition'], Quantity):
+        data['definition'].system = result.reference
     return result
 
 class Quantity:
+  __slots__ = ['value', 'error', 'units', 'system']
+
   def __init__(self, value, error, units, system):
     self.value = value
     self.error = error
-    self.units = units
+    self.units = units if type(units) is Units else Units(units)
     if isinstance(system, weakref.ref):
       self.system = system
     else:
-      self.system = weakref.ref(system)
+      self.system = system.reference
 
   def __pos__(self):
     return Quantity(self.value, self.error, self.units, self.system)
@@ -226,6 +1018,10 @@ class Quantity:
 
   def __add__(self, other):
     if isinstance(other, Quantity) and self.system is other.system:
+      if self.units is other.units:
+        value = self.value + other.value
+        error = math.hypot(self.error, other.error)
+        return Quantity(value, error, self.units, self.system)
       first, second = self.expand(), other.expand()
       if first.units == second.units:
         value = first.value + second.value
@@ -242,6 +1038,10 @@ class Quantity:
 
   def __sub__(self, other):
     if isinstance(other, Quantity) and self.system is other.system:
+      if self.units is other.units:
+        value = self.value - other.value
+        error = math.hypot(self.error, other.error)
+        return Quantity(value, error, self.units, self.system)
       first, second = self.expand(), other.expand()
       if first.units == second.units:
         value = first.value - second.value
@@ -347,8 +1147,7 @@ class Quantity:
     return not self == other
 
   def __hash__(self):
-    return hash((self.value, self.error,
-      tuple(sorted(self.units.items())), self.system))
+    return hash((self.value, self.error, self.units, self.system))
 
   def almost_equals(self, other):
     if isinstance(other, Quantity) and self.system is other.system:
@@ -375,12 +1174,45 @@ class Quantity:
     else:
       return self
 
+  def to(self, target):
+    system = self.system()
+    units = system.target_units(target)
+    if type(self) is not Quantity:
+      # quantities of other kinds, such as correlated ones, are converted by
+      # their own arithmetic
+      unit = Quantity(1, 0, units, system)
+      ratio = (self / unit).expand()
+      if ratio.units:
+        raise TypeError('units cannot be converted to {}'.format(
+          system.format_units(units)))
+      return ratio * unit
+    factor, factor_error = system.conversion_plan(self.units, units)
+    if factor_error:
+      error = math.hypot(self.error * factor, factor_error * self.value)
+    else:
+      error = abs(self.error * factor)
+    return Quantity(self.value * factor, error, units, self.system)
+
   def copy(self):
-    return Quantity(self.value, self.error, self.units.copy(), self.system)
+    return Quantity(self.value, self.error, self.units, self.system)
+
+  def __deepcopy__(self, memo):
+    # the system is not copied along with the quantity
+    return self.copy()
+
+  def __getstate__(self):
+    system = self.system() if self.system is not None else None
+    return self.value, self.error, self.units, system
+
+  def __setstate__(self, state):
+    self.value, self.error, self.units, system = state
+    # the system may not have been restored yet, but its weak reference is the
+    # same object that it creates for itself
+    self.system = weakref.ref(system) if system is not None else None
 
   def __repr__(self):
-    kwargs = ', '.join('{}={}'.format(key, repr(self.__dict__[key]))
-      for key in ['value', 'error', 'units', 'system'])
+    kwargs = ', '.join('{}={}'.format(key, repr(getattr(self, key)))
+      for key in self.__slots__)
     return '{}({})'.format(self.__class__.__name__, kwargs)
 
   def __str__(self):
@@ -0,0 +1,290 @@
+import math
+import numbers
+import weakref
+
+from .core import Quantity, UnitArithmetic, Units
+
+# correlated quantities carry the gradient of their value with respect to
+# independent variables instead of an error; an operation only records its
+# operands and the derivatives of its result with respect to them, and the
+# sparse gradient is accumulated through the recorded operations when it is
+# first requested, such as when the error is, so that both memory and time
+# grow linearly with the number of operations and variables
+
+class Variable:
+  # an independent input, identified by the object rather than by its name
+  __slots__ = ['name', 'error']
+
+  def __init__(self, name, error):
+    self.name = name
+    self.error = error
+
+  def __repr__(self):
+    return 'Variable({!r}, {!r})'.format(self.name, self.error)
+
+def accumulate(quantity):
+  # operations are visited in reverse topological order, from the quantity to
+  # the quantities whose gradients are known, carrying the derivative of the
+  # quantity with respect to each of them
+  order, visited, stack = [], set(), [(quantity, False)]
+  while stack:
+    node, finished = stack.pop()
+    if finished:
+      order.append(node)
+    elif id(node) not in visited:
+      visited.add(id(node))
+      stack.append((node, True))
+      if node.known_gradient is None:
+        stack.extend((operand, False) for operand, _ in node.terms
+          if id(operand) not in visited)
+  derivatives = {id(quantity): 1}
+  result = {}
+  for node in reversed(order):
+    derivative = derivatives.pop(id(node), 0)
+    if not derivative:
+      continue
+    if node.known_gradient is not None:
+      for variable, partial in node.known_gradient.items():
+        result[variable] = result.get(variable, 0) + derivative * partial
+    else:
+      for operand, partial in node.terms:
+        derivatives[id(operand)] = (
+          derivatives.get(id(operand), 0) + derivative * partial)
+  return {variable: derivative for variable, derivative in result.items()
+    if derivative}
+
+# the errors of units defined in plain systems are represented by a variable
+# for each unit, which is replaced if the unit is redefined; the variables of
+# a system are released with it
+unit_variables = weakref.WeakKeyDictionary()
+
+def unit_expansion(system, unit):
+  data = system.unit_data(unit)
+  expansion = data['expansion'] if data is not None else None
+  if expansion is None:
+    return Correlated(1, {}, {unit: 1}, system)
+  elif isinstance(expansion, Correlated):
+    return expansion
+  elif isinstance(expansion, Quantity):
+    if expansion.error == 0:
+      gradient = {}
+    else:
+      variables = unit_variables.setdefault(system, {})
+      if unit not in variables or variables[unit][0] is not expansion:
+        variables[unit] = expansion, Variable(unit, expansion.error)
+      gradient = {variables[unit][1]: 1}
+    return Correlated(expansion.value, gradient, expansion.units, system)
+  else:
+    return Correlated(expansion, {}, {}, system)
+
+class Correlated(Quantity):
+  __slots__ = ['known_gradient', 'terms']
+
+  def __init__(self, value, gradient, units, system):
+    self.value = value
+    self.known_gradient = gradient
+    self.terms = ()
+    self.units = units if type(units) is Units else Units(units)
+    if isinstance(system, weakref.ref):
+      self.system = system
+    else:
+      self.system = system.reference
+
+  @classmethod
+  def from_terms(cls, value, terms, units, system):
+    # terms are pairs of operands and the derivatives with respect to them;
+    # those that cannot contribute are left out
+    result = cls(value, None, units, system)
+    result.terms = tuple((operand, derivative) for operand, derivative in terms
+      if derivative and operand.varies())
+    if not result.terms:
+      result.known_gradient = {}
+    return result
+
+  @classmethod
+  def independent(cls, value, error, units, system, name=None):
+    gradient = {Variable(name, error): 1} if error else {}
+    return cls(value, gradient, units, system)
+
+  @classmethod
+  def from_quantity(cls, quantity, name=None):
+    # the error of a plain quantity becomes a new independent variable each
+    # time it is converted
+    if isinstance(quantity, Correlated):
+      return quantity
+    return cls.independent(quantity.value, quantity.error, quantity.units,
+      quantity.system, name)
+
+  def varies(self):
+    return bool(self.terms or self.known_gradient)
+
+  @property
+  def gradient(self):
+    if self.known_gradient is None:
+      self.known_gradient = accumulate(self)
+      # the operations are no longer needed once the gradient is known
+      self.terms = ()
+    return self.known_gradient
+
+  @property
+  def error(self):
+    return math.sqrt(math.fsum((derivative * variable.error)**2
+      for variable, derivative in self.gradient.items()))
+
+  def covariance(self, other):
+    other = self.coerce(other)
+    if other is None:
+      raise TypeError('quantities do not have the same system')
+    first, second = self.gradient, other.gradient
+    if len(second) < len(first):
+      first, second = second, first
+    return math.fsum(derivative * second[variable] * variable.error**2
+      for variable, derivative in first.items() if variable in second)
+
+  def correlation(self, other):
+    other = self.coerce(other)
+    if other is None:
+      raise TypeError('quantities do not have the same system')
+    return self.covariance(other) / (self.error * other.error)
+
+  def coerce(self, other):
+    if isinstance(other, Quantity):
+      if other.system is self.system:
+        return Correlated.from_quantity(other)
+    elif isinstance(other, numbers.Real):
+      return Correlated(other, {}, {}, self.system)
+    return None
+
+  def __pos__(self):
+    return self.copy()
+
+  def __neg__(self):
+    return Correlated.from_terms(-self.value, [(self, -1)], self.units,
+      self.system)
+
+  def __abs__(self):
+    sign = -1 if self.value < 0 else 1
+    return Correlated.from_terms(abs(self.value), [(self, sign)], self.units,
+      self.system)
+
+  def add(self, other, sign):
+    if isinstance(other, numbers.Real) and other == 0:
+      return +self
+    other = self.coerce(other)
+    if other is None:
+      return NotImplemented
+    first, second = self, other
+    if first.units is not second.units:
+      first, second = first.expand(), second.expand()
+      if first.units != second.units:
+        return NotImplemented
+    return Correlated.from_terms(first.value + sign * second.value,
+      [(first, 1), (second, sign)], first.units, first.system)
+
+  def __add__(self, other):
+    return self.add(other, 1)
+
+  def __sub__(self, other):
+    return self.add(other, -1)
+
+  def __mul__(self, other):
+    other = self.coerce(other)
+    if other is None:
+      return NotImplemented
+    return Correlated.from_terms(self.value * other.value,
+      [(self, other.value), (other, self.value)],
+      UnitArithmetic.multiply(self.units, other.units), self.system)
+
+  def __truediv__(self, other):
+    other = self.coerce(other)
+    if other is None:
+      return NotImplemented
+    return Correlated.from_terms(self.value / other.value,
+      [(self, 1 / other.value), (other, -self.value / other.value**2)],
+      UnitArithmetic.divide(self.units, other.units), self.system)
+
+  def __pow__(self, other):
+    if isinstance(other, numbers.Real):
+      terms = []
+      if self.varies():
+        terms.append((self, other * self.value ** (other - 1)))
+      return Correlated.from_terms(self.value ** other, terms,
+        UnitArithmetic.power(self.units, other), self.system)
+    other = self.coerce(other)
+    if other is None:
+      return NotImplemented
+    first, second = self.expand(), other.expand()
+    if not first.units and not second.units:
+      value = first.value ** second.value
+      terms = []
+      if first.varies():
+        terms.append(
+          (first, second.value * first.value ** (second.value - 1)))
+      if second.varies():
+        terms.append((second, math.log(first.value) * value))
+      return Correlated.from_terms(value, terms, {}, first.system)
+    elif first.units and not second.gradient and not second.units:
+      return first ** second.value
+    return NotImplemented
+
+  def __radd__(self, other):
+    other = self.coerce(other)
+    return NotImplemented if other is None else other.add(self, 1)
+
+  def __rsub__(self, other):
+    other = self.coerce(other)
+    return NotImplemented if other is None else other.add(self, -1)
+
+  def __rmul__(self, other):
+    other = self.coerce(other)
+    return NotImplemented if other is None else other * self
+
+  def __rtruediv__(self, other):
+    other = self.coerce(other)
+    return NotImplemented if other is None else other / self
+
+  def __rpow__(self, other):
+    other = self.coerce(other)
+    return NotImplemented if other is None else other ** self
+
+  def apply_function(self, function, args):
+    # called by the extended functions, which only accept unitless arguments
+    args = [self.coerce(arg) for arg in args]
+    if any(arg is None for arg in args):
+      raise TypeError('arguments do not have the same system')
+    args = [arg.expand() for arg in args]
+    if any(arg.units for arg in args):
+      raise TypeError('arguments are not all unitless')
+    values = [arg.value for arg in args]
+    return Correlated.from_terms(function.__wrapped__(*values),
+      [(arg, deriv(math, *values)) for arg, deriv in zip(args, function.derivs)
+        if arg.varies()], {}, self.system)
+
+  def expand(self):
+    return self.expand_in(self.system())
+
+  def expand_in(self, system):
+    # units are replaced by their expansions in the given system, whose own
+    # errors are correlated with those of other quantities using the units
+    result = Correlated.from_terms(self.value, [(self, 1)], {}, system)
+    for unit, power in self.units.items():
+      result *= unit_expansion(system, unit) ** power
+    return result
+
+  def copy(self):
+    return Correlated.from_terms(self.value, [(self, 1)], self.units,
+      self.system)
+
+  def __getstate__(self):
+    system = self.system() if self.system is not None else None
+    return self.value, self.gradient, self.units, system
+
+  def __setstate__(self, state):
+    self.value, self.known_gradient, self.units, system = state
+    self.terms = ()
+    self.system = weakref.ref(system) if system is not None else None
+
+  def __repr__(self):
+    kwargs = ', '.join('{}={}'.format(key, repr(getattr(self, key)))
+      for key in ['value', 'gradient', 'units', 'system'])
+    return '{}({})'.format(self.__class__.__name__, kwargs)
@@ -0,0 +1,314 @@
+import collections.abc
+import math
+import numbers
+import operator
+
+from .core import Quantity, UnitArithmetic, Units
+
+class Trace:
+  # stands in for a quantity that depends on the inputs of a formula while
+  # the formula is traced; it carries the units of the quantity in terms of
+  # base units and the register holding its value when the formula is run
+  __slots__ = ['formula', 'index', 'units']
+
+  def __init__(self, formula, index, units):
+    self.formula = formula
+    self.index = index
+    self.units = units
+
+  def record(self, function, units, *args):
+    return self.formula.record(function, units, args)
+
+  def operand(self, other):
+    # returns the units of the operand, or None if it cannot take part in
+    # the formula
+    if isinstance(other, Trace):
+      if other.formula is self.formula:
+        return other.units
+    elif isinstance(other, Quantity):
+      if other.system is self.formula.system.reference:
+        return other.expand().units
+    elif isinstance(other, numbers.Real):
+      return Units()
+    return None
+
+  def __pos__(self):
+    return self.record(operator.pos, self.units, self)
+
+  def __neg__(self):
+    return self.record(operator.neg, self.units, self)
+
+  def __abs__(self):
+    return self.record(operator.abs, self.units, self)
+
+  def __add__(self, other):
+    if self.operand(other) == self.units:
+      return self.record(operator.add, self.units, self, other)
+    return NotImplemented
+
+  def __sub__(self, other):
+    if self.operand(other) == self.units:
+      return self.record(operator.sub, self.units, self, other)
+    return NotImplemented
+
+  def __mul__(self, other):
+    units = self.operand(other)
+    if units is not None:
+      return self.record(operator.mul,
+        UnitArithmetic.multiply(self.units, units), self, other)
+    return NotImplemented
+
+  def __truediv__(self, other):
+    units = self.operand(other)
+    if units is not None:
+      return self.record(operator.truediv,
+        UnitArithmetic.divide(self.units, units), self, other)
+    return NotImplemented
+
+  def __pow__(self, other):
+    units = self.operand(other)
+    if units is None or units:
+      return NotImplemented
+    if isinstance(other, numbers.Real):
+      return self.record(operator.pow,
+        UnitArithmetic.power(self.units, other), self, other)
+    elif isinstance(other, Quantity) and self.units:
+      other = other.expand()
+      if other.error == 0:
+        return self.record(operator.pow,
+          UnitArithmetic.power(self.units, other.value), self, other.value)
+    elif not self.units:
+      return self.record(operator.pow, Units(), self, other)
+    return NotImplemented
+
+  def __radd__(self, other):
+    if self.operand(other) == self.units:
+      return self.record(operator.add, self.units, other, self)
+    return NotImplemented
+
+  def __rsub__(self, other):
+    if self.operand(other) == self.units:
+      return self.record(operator.sub, self.units, other, self)
+    return NotImplemented
+
+  def __rmul__(self, other):
+    units = self.operand(other)
+    if units is not None:
+      return self.record(operator.mul,
+        UnitArithmetic.multiply(units, self.units), other, self)
+    return NotImplemented
+
+  def __rtruediv__(self, other):
+    units = self.operand(other)
+    if units is not None:
+      return self.record(operator.truediv,
+        UnitArithmetic.divide(units, self.units), other, self)
+    return NotImplemented
+
+  def __rpow__(self, other):
+    if not self.units and self.operand(other) == Units():
+      return self.record(operator.pow, Units(), other, self)
+    return NotImplemented
+
+  def apply_function(self, function, args):
+    # called by the extended functions, which only accept unitless arguments
+    if not all(self.operand(arg) == Units() for arg in args):
+      raise TypeError('arguments are not all unitless')
+    return self.record(function, Units(), *args)
+
+  def __float__(self):
+    raise TypeError('traced quantity has no value')
+
+# scalar formulas are run on pairs of values and errors, which propagate
+# errors in the same way as unitless quantities but without creating objects
+
+def add_pairs(first, second):
+  return first[0] + second[0], math.hypot(first[1], second[1])
+
+def subtract_pairs(first, second):
+  return first[0] - second[0], math.hypot(first[1], second[1])
+
+def multiply_pairs(first, second):
+  return (first[0] * second[0],
+    math.hypot(first[1] * second[0], second[1] * first[0]))
+
+def divide_pairs(first, second):
+  return (first[0] / second[0], math.hypot(first[1] / second[0],
+    second[1] * first[0] / second[0]**2))
+
+def power_pairs(first, second):
+  value = first[0] ** second[0]
+  if first[0] == 0:
+    error = first[1] ** second[0]
+  elif second[1] == 0:
+    error = abs(second[0] * value / first[0] * first[1])
+  else:
+    error = value * math.hypot(second[0] / first[0] * first[1],
+      math.log(first[0]) * second[1])
+  return value, error
+
+def is_scalar(value):
+  # checking the built-in types first avoids the slower abstract base class
+  return isinstance(value, (float, int)) or isinstance(value, numbers.Real)
+
+def positive_pair(first):
+  return first
+
+def negative_pair(first):
+  return -first[0], first[1]
+
+def absolute_pair(first):
+  return abs(first[0]), first[1]
+
+pair_functions = {
+  operator.pos: positive_pair,
+  operator.neg: negative_pair,
+  operator.abs: absolute_pair,
+  operator.add: add_pairs,
+  operator.sub: subtract_pairs,
+  operator.mul: multiply_pairs,
+  operator.truediv: divide_pairs,
+  operator.pow: power_pairs}
+
+class Formula:
+  def __init__(self, system, function, inputs):
+    self.system = system
+    self.function = function
+    self.inputs = list(inputs)
+    self.input_units = []
+    self.scales = []
+    self.scale_pairs = []
+    self.steps = []
+    self.pair_steps = []
+    traces = []
+    for index, (name, units) in enumerate(inputs.items()):
+      if isinstance(units, str):
+        units = Quantity(1, 0, {units: 1}, system)
+      elif isinstance(units, collections.abc.Mapping):
+        units = Quantity(1, 0, units, system)
+      elif not isinstance(units, Quantity) or units.system() is not system:
+        raise TypeError('units of input {} are not in terms of system units'
+          .format(name))
+      self.input_units.append(units)
+      scale = self.constant(units)
+      self.scales.append(scale)
+      if scale.value == 1 and scale.error == 0:
+        self.scale_pairs.append(None)
+      else:
+        self.scale_pairs.append((scale.value, scale.error))
+      traces.append(Trace(self, index, units.expand().units))
+    result = function(*traces)
+    if isinstance(result, (Trace, Quantity, numbers.Real)):
+      # the output is stored in the same way as arguments to steps
+      self.output = self.argument(result)
+      self.units = self.operand_units(result)
+    else:
+      raise TypeError('formula does not return a quantity')
+
+  def constant(self, quantity):
+    # constants take part in the formula as unitless quantities whose values
+    # are in terms of base units
+    quantity = quantity.expand()
+    return Quantity(quantity.value, quantity.error, {}, self.system)
+
+  def argument(self, arg):
+    # each argument is either the index of a register or a constant
+    if isinstance(arg, Trace):
+      return True, arg.index
+    elif isinstance(arg, Quantity):
+      return False, self.constant(arg)
+    else:
+      return False, arg
+
+  @staticmethod
+  def pair_argument(arg):
+    is_register, arg = arg
+    if is_register:
+      return True, arg
+    elif isinstance(arg, Quantity):
+      return False, (arg.value, arg.error)
+    else:
+      return False, (arg, 0)
+
+  def pair_function(self, function):
+    if function in pair_functions:
+      return pair_functions[function]
+    def wrapper(*pairs):
+      result = function(*[Quantity(value, error, {}, self.system)
+        for value, error in pairs])
+      return result.value, result.error
+    return wrapper
+
+  @staticmethod
+  def operand_units(arg):
+    if isinstance(arg, Trace):
+      return arg.units
+    elif isinstance(arg, Quantity):
+      return arg.expand().units
+    else:
+      return Units()
+
+  def record(self, function, units, args):
+    args = [self.argument(arg) for arg in args]
+    self.steps.append((function, args))
+    self.pair_steps.append(self.pair_step(function, args))
+    return Trace(self, len(self.inputs) + len(self.steps) - 1, units)
+
+  def pair_step(self, function, args):
+    return (self.pair_function(function),
+      [self.pair_argument(arg) for arg in args])
+
+  def __getstate__(self):
+    # the steps on pairs wrap the extended functions in closures, and are
+    # rebuilt from the steps, so that formulas can be sent to other
+    # processes; the compiled function, which may be a lambda, is not needed
+    state = self.__dict__.copy()
+    del state['pair_steps']
+    state['function'] = None
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self.pair_steps = [self.pair_step(function, args)
+      for function, args in self.steps]
+
+  def __call__(self, *args, errors=None, **kwargs):
+    values = list(args)
+    if kwargs:
+      values += [kwargs.pop(name) for name in self.inputs[len(args):]
+        if name in kwargs]
+    if kwargs or len(values) != len(self.inputs):
+      raise TypeError('expected arguments {}'.format(', '.join(self.inputs)))
+    if errors is None:
+      errors = [0] * len(values)
+    elif isinstance(errors, collections.abc.Mapping):
+      unknown = [name for name in errors if name not in self.inputs]
+      if unknown:
+        raise TypeError('unexpected errors of {}'.format(', '.join(unknown)))
+      errors = [errors.get(name, 0) for name in self.inputs]
+    elif len(errors) != len(values):
+      raise TypeError('expected errors of {}'.format(', '.join(self.inputs)))
+    if all(map(is_scalar, values)) and all(map(is_scalar, errors)):
+      registers = [(value, error) if scale is None else
+        multiply_pairs((value, error), scale)
+        for value, error, scale in zip(values, errors, self.scale_pairs)]
+      steps = self.pair_steps
+    else:
+      # NumPy is only needed for array inputs
+      from .array import QuantityArray
+      registers = [QuantityArray(value, error, {}, self.system) * scale
+        for value, error, scale in zip(values, errors, self.scales)]
+      steps = self.steps
+    for function, args in steps:
+      registers.append(function(*[registers[arg] if is_register else arg
+        for is_register, arg in args]))
+    is_register, result = self.output
+    if is_register:
+      result = registers[result]
+    if isinstance(result, tuple):
+      return Quantity(result[0], result[1], self.units, self.system)
+    elif isinstance(result, numbers.Real):
+      return Quantity(result, 0, self.units, self.system)
+    else:
+      return type(result)(result.value, result.error, self.units,
+        self.system)
@@ -1,15 +1,42 @@
 import fractions
 import functools
+import itertools
 import math
+import numbers
+import operator
+import sys
 
-from .core import Quantity
+from .core import Quantity, UnitArithmetic, Units
+
+# NumPy is an optional dependency, and is slow to import, so it is only used
+# once it has been imported, as it must have been for arrays to be given
 
 def sqrt(x):
+  numpy = sys.modules.get('numpy')
+  if numpy is not None and isinstance(x, numpy.ndarray):
+    return numpy.sqrt(x)
   return x ** fractions.Fraction(1, 2)
 
-def wrap_unitless_function(func, *derivs):
+def is_array(arg):
+  numpy = sys.modules.get('numpy')
+  if numpy is None:
+    return False
+  from .array import QuantityArray
+  return isinstance(arg, (QuantityArray, numpy.ndarray))
+
+def wrap_unitless_function(func, ufunc, *derivs):
+  # the derivatives take the module providing elementary functions, either
+  # math or numpy, as their first argument, so that the same definitions
+  # serve both scalar and array arguments
   @functools.wraps(func)
   def wrapper(*args):
+    for arg in args:
+      # quantities of other kinds, such as those traced while compiling a
+      # formula, may handle the function themselves
+      if hasattr(arg, 'apply_function'):
+        return arg.apply_function(wrapper, args)
+    if any(is_array(arg) for arg in args):
+      return apply_ufunc(ufunc, derivs, args)
     try:
       args = Quantity.make_same_system(args)
     except TypeError:
@@ -20,52 +47,199 @@ def wrap_unitless_function(func, *derivs):
         if all(not arg.units for arg in args):
           arg_values = [arg.value for arg in args]
           value = func(*arg_values)
-          error = math.sqrt(sum((deriv(*arg_values) * arg.error)**2
+          error = math.sqrt(sum((deriv(math, *arg_values) * arg.error)**2
             for arg, deriv in zip(args, derivs)))
           return Quantity(value, error, {}, args[0].system)
     return func(*args)
+  wrapper.derivs = derivs
+  # the wrapper is pickled by reference to this module, as the module level
+  # function of the same name, rather than to the math module
+  wrapper.__module__ = __name__
+  wrapper.__qualname__ = func.__name__
   return wrapper
 
-exp = wrap_unitless_function(math.exp,
-  math.exp)
-expm1 = wrap_unitless_function(math.expm1,
-  math.exp)
-log = wrap_unitless_function(math.log,
-  lambda x, base=math.e: 1 / x / math.log(base),
-  lambda x, base=math.e: -math.log(x) / base / math.log(base)**2)
-log1p = wrap_unitless_function(math.log1p,
-  lambda x, base=math.e: 1 / x)
-log2 = wrap_unitless_function(math.log2,
-  lambda x: 1 / x / math.log(2))
-log10 = wrap_unitless_function(math.log10,
-  lambda x: 1 / x / math.log(10))
-sin = wrap_unitless_function(math.sin,
-  math.cos)
-cos = wrap_unitless_function(math.cos,
-  lambda x: -math.sin(x))
-tan = wrap_unitless_function(math.tan,
-  lambda x: math.cos(x)**-2)
-asin = wrap_unitless_function(math.asin,
-  lambda x: 1 / math.sqrt(1 - x**2))
-acos = wrap_unitless_function(math.acos,
-  lambda x: -1 / math.sqrt(1 - x**2))
-atan = wrap_unitless_function(math.atan,
-  lambda x: 1 / (1 + x**2))
-atan2 = wrap_unitless_function(math.atan2,
-  lambda y, x: x / (x**2 + y**2),
-  lambda y, x: -y / (x**2 + y**2))
-sinh = wrap_unitless_function(math.sinh,
-  math.cosh)
-cosh = wrap_unitless_function(math.cosh,
-  math.sinh)
-tanh = wrap_unitless_function(math.tanh,
-  lambda x: math.cosh(x)**-2)
-asinh = wrap_unitless_function(math.asinh,
-  lambda x: 1 / math.hypot(1, x))
-acosh = wrap_unitless_function(math.acosh,
-  lambda x: 1 / math.sqrt(x**2 - 1))
-atanh = wrap_unitless_function(math.atanh,
-  lambda x: 1 / (1 - x**2))
+def apply_ufunc(ufunc, derivs, args):
+  import numpy
+  from .array import QuantityArray
+  if isinstance(ufunc, str):
+    ufunc = getattr(numpy, ufunc)
+  systems = [arg.system for arg in args
+    if isinstance(arg, (Quantity, QuantityArray))]
+  if not systems:
+    return ufunc(*args)
+  if not all(system is systems[0] for system in systems):
+    raise TypeError('arguments do not have the same system')
+  # units are checked once for each argument rather than for each element
+  values, errors = [], []
+  for arg in args:
+    if isinstance(arg, (Quantity, QuantityArray)):
+      arg = arg.expand()
+      if arg.units:
+        raise TypeError('arguments are not all unitless')
+      values.append(numpy.asarray(arg.value, dtype=float))
+      errors.append(numpy.asarray(arg.error, dtype=float))
+    else:
+      values.append(numpy.asarray(arg, dtype=float))
+      errors.append(0)
+  value = ufunc(*values)
+  error = numpy.sqrt(sum((deriv(numpy, *values) * error)**2
+    for error, deriv in zip(errors, derivs)))
+  return QuantityArray(value, error, {}, systems[0])
+
+def log_ufunc(x, base=math.e):
+  import numpy
+  return numpy.log(x) / numpy.log(base)
+
+exp = wrap_unitless_function(math.exp, 'exp',
+  lambda m, x: m.exp(x))
+expm1 = wrap_unitless_function(math.expm1, 'expm1',
+  lambda m, x: m.exp(x))
+log = wrap_unitless_function(math.log, log_ufunc,
+  lambda m, x, base=math.e: 1 / x / m.log(base),
+  lambda m, x, base=math.e: -m.log(x) / base / m.log(base)**2)
+log1p = wrap_unitless_function(math.log1p, 'log1p',
+  lambda m, x: 1 / (1 + x))
+log2 = wrap_unitless_function(math.log2, 'log2',
+  lambda m, x: 1 / x / m.log(2))
+log10 = wrap_unitless_function(math.log10, 'log10',
+  lambda m, x: 1 / x / m.log(10))
+sin = wrap_unitless_function(math.sin, 'sin',
+  lambda m, x: m.cos(x))
+cos = wrap_unitless_function(math.cos, 'cos',
+  lambda m, x: -m.sin(x))
+tan = wrap_unitless_function(math.tan, 'tan',
+  lambda m, x: m.cos(x)**-2)
+asin = wrap_unitless_function(math.asin, 'arcsin',
+  lambda m, x: 1 / m.sqrt(1 - x**2))
+acos = wrap_unitless_function(math.acos, 'arccos',
+  lambda m, x: -1 / m.sqrt(1 - x**2))
+atan = wrap_unitless_function(math.atan, 'arctan',
+  lambda m, x: 1 / (1 + x**2))
+atan2 = wrap_unitless_function(math.atan2, 'arctan2',
+  lambda m, y, x: x / (x**2 + y**2),
+  lambda m, y, x: -y / (x**2 + y**2))
+sinh = wrap_unitless_function(math.sinh, 'sinh',
+  lambda m, x: m.cosh(x))
+cosh = wrap_unitless_function(math.cosh, 'cosh',
+  lambda m, x: m.sinh(x))
+tanh = wrap_unitless_function(math.tanh, 'tanh',
+  lambda m, x: m.cosh(x)**-2)
+asinh = wrap_unitless_function(math.asinh, 'arcsinh',
+  lambda m, x: 1 / m.hypot(1, x))
+acosh = wrap_unitless_function(math.acosh, 'arccosh',
+  lambda m, x: 1 / m.sqrt(x**2 - 1))
+atanh = wrap_unitless_function(math.atanh, 'arctanh',
+  lambda m, x: 1 / (1 - x**2))
+
+def unit_pairs(items):
+  # gives the values and squared errors of the quantities and numbers among
+  # the items as pairs, in the units of the first quantity, into which the
+  # others are converted by cached factors, together with the system and
+  # units of that quantity; the loop stops at an item of another kind, such
+  # as a correlated quantity, which is given in a list with the pairs
+  pairs, system, units, nonzero_number = [], None, None, False
+  for item in items:
+    if type(item) is Quantity:
+      if system is None:
+        # quantities that are unitless once expanded are added as numbers
+        system, units = item.system, item.units
+        if not system().expand_units(units).units:
+          units = Units()
+        elif nonzero_number:
+          raise TypeError('numbers cannot be added to quantities with units')
+      elif item.system is not system:
+        raise TypeError('quantities do not have the same system')
+      if item.units is units:
+        value, error = item.value, item.error
+      else:
+        factor, factor_error = system().conversion_plan(item.units, units)
+        value, error = item.value * factor, math.hypot(item.error * factor,
+          factor_error * item.value)
+    elif isinstance(item, numbers.Real):
+      value, error = item, 0
+      if item != 0:
+        if units:
+          raise TypeError('numbers cannot be added to quantities with units')
+        nonzero_number = True
+    else:
+      return pairs, system, units, [item]
+    pairs.append((value, error * error))
+  return pairs, system, units, []
+
+def fsum(iterable):
+  # values are added exactly by math.fsum in the units of the first quantity,
+  # and errors in quadrature, in a single pass over the items; items of other
+  # kinds, and those after them, are added by their own arithmetic
+  items = iter(iterable)
+  pairs, system, units, rest = unit_pairs(items)
+  result = math.fsum(value for value, _ in pairs)
+  if system is not None:
+    result = Quantity(result, math.sqrt(math.fsum(
+      variance for _, variance in pairs)), units, system)
+  if rest:
+    # items of other kinds need not support adding a number
+    if system is None and not result:
+      result = +rest[0]
+    else:
+      result = result + rest[0]
+    result = functools.reduce(operator.add, items, result)
+  return result
+
+def prod(iterable):
+  # units are multiplied by cached arithmetic, and errors are propagated to
+  # first order, in a single pass over the items; items of other kinds, and
+  # those after them, are multiplied by their own arithmetic
+  items = iter(iterable)
+  value, error, units, system = 1, 0, Units(), None
+  for item in items:
+    if type(item) is Quantity:
+      if system is None:
+        system = item.system
+      elif item.system is not system:
+        raise TypeError('quantities do not have the same system')
+      error = math.hypot(error * item.value, value * item.error)
+      value *= item.value
+      units = UnitArithmetic.multiply(units, item.units)
+    elif isinstance(item, numbers.Real):
+      error = abs(error * item)
+      value *= item
+    else:
+      result = value if system is None else Quantity(value, error, units,
+        system)
+      return functools.reduce(operator.mul, items, result * item)
+  return value if system is None else Quantity(value, error, units, system)
+
+def weighted_mean(iterable):
+  # the mean of the items weighted by the inverses of their variances, in the
+  # units of the first quantity, in a single pass over the items; items of
+  # other kinds, and those after them, are weighted by their own arithmetic
+  items = iter(iterable)
+  pairs, system, units, rest = unit_pairs(items)
+  if not all(variance for _, variance in pairs):
+    raise ValueError('values without errors cannot be weighted')
+  numerator = math.fsum(value / variance for value, variance in pairs)
+  weight = math.fsum(1 / variance for _, variance in pairs)
+  if rest:
+    # items of other kinds need not support adding a number
+    if system is None:
+      numerator = None
+    else:
+      numerator = Quantity(numerator, math.sqrt(weight), units, system)
+    for item in itertools.chain(rest, items):
+      if not getattr(item, 'error', 0):
+        raise ValueError('values without errors cannot be weighted')
+      if units is None:
+        units = item.units
+      item = item.to(units)
+      item_weight = item.error**-2
+      term = item * item_weight
+      numerator = term if numerator is None else numerator + term
+      weight += item_weight
+  if not weight:
+    raise ValueError('no values given')
+  if rest or system is None:
+    return numerator / weight
+  return Quantity(numerator / weight, weight**-0.5, units, system)
 
 extended_functions = [sqrt, exp, expm1, log, log1p, log2, log10, sin, cos, tan,
   asin, acos, atan, atan2, sinh, cosh, tanh, asinh, acosh, atanh]
@@ -0,0 +1,155 @@
+import collections
+import contextlib
+import functools
+import threading
+import time
+import weakref
+
+from .core import Quantity, UnitArithmetic, UnitSystem
+
+# instrumentation replaces methods of the core classes with counting and
+# timing wrappers while it is enabled, and restores the original methods when
+# it is disabled, so that it costs nothing otherwise; times are inclusive of
+# nested calls
+
+Stats = collections.namedtuple('Stats', ['counts', 'times', 'max_depth'])
+
+class Record:
+  def __init__(self):
+    self.counts = collections.Counter()
+    self.times = collections.Counter()
+    self.max_depth = 0
+
+class ActiveSystems(threading.local):
+  # systems whose instrumented methods are being run by a thread, innermost
+  # last, with whether the calls count towards the depth of nesting
+  def __init__(self):
+    self.stack = []
+
+records = weakref.WeakKeyDictionary()
+# records of calls made outside of any method of a system
+global_record = Record()
+active_systems = ActiveSystems()
+originals = {}
+enabled_count = 0
+
+def get_record(system):
+  if system is None:
+    return global_record
+  try:
+    return records[system]
+  except KeyError:
+    result = records[system] = Record()
+    return result
+
+def stats(system=None):
+  record = get_record(system)
+  return Stats(dict(record.counts), dict(record.times), record.max_depth)
+
+def reset():
+  records.clear()
+  global_record.__init__()
+
+def system_method(function, category, depth=False):
+  @functools.wraps(function)
+  def wrapper(self, *args, **kwargs):
+    record = get_record(self)
+    record.counts[category] += 1
+    stack = active_systems.stack
+    stack.append((self, depth))
+    if depth:
+      record.max_depth = max(record.max_depth,
+        sum(nested for system, nested in stack if system is self))
+    start = time.perf_counter()
+    try:
+      return function(self, *args, **kwargs)
+    finally:
+      record.times[category] += time.perf_counter() - start
+      stack.pop()
+  return wrapper
+
+def system_generator(function, category):
+  # formatted items are counted and timed as they are generated
+  @functools.wraps(function)
+  def wrapper(self, *args, **kwargs):
+    record = get_record(self)
+    iterator = function(self, *args, **kwargs)
+    while True:
+      start = time.perf_counter()
+      try:
+        item = next(iterator)
+      except StopIteration:
+        return
+      finally:
+        record.times[category] += time.perf_counter() - start
+      record.counts[category] += 1
+      yield item
+  return wrapper
+
+def quantity_init(function):
+  @functools.wraps(function)
+  def wrapper(self, *args, **kwargs):
+    start = time.perf_counter()
+    function(self, *args, **kwargs)
+    record = get_record(self.system())
+    record.times['quantity'] += time.perf_counter() - start
+    record.counts['quantity'] += 1
+  return wrapper
+
+def clean(function):
+  # units are cleaned on behalf of the innermost system being run, if any
+  @functools.wraps(function)
+  def wrapper(units):
+    start = time.perf_counter()
+    try:
+      return function(units)
+    finally:
+      stack = active_systems.stack
+      record = get_record(stack[-1][0] if stack else None)
+      record.times['clean'] += time.perf_counter() - start
+      record.counts['clean'] += 1
+  return staticmethod(wrapper)
+
+def wrappers():
+  return [
+    (Quantity, '__init__', quantity_init(Quantity.__init__)),
+    (UnitArithmetic, 'clean', clean(UnitArithmetic.clean)),
+    (UnitSystem, 'expand_quantity', system_method(
+      UnitSystem.expand_quantity, 'expand_quantity', depth=True)),
+    (UnitSystem, 'expand_units', system_method(
+      UnitSystem.expand_units, 'expand_units', depth=True)),
+    (UnitSystem, 'format_quantity', system_method(
+      UnitSystem.format_quantity, 'format')),
+    (UnitSystem, 'format_many', system_generator(
+      UnitSystem.format_many, 'format')),
+    (UnitSystem, 'format_values', system_generator(
+      UnitSystem.format_values, 'format'))]
+
+def enable():
+  global enabled_count
+  if enabled_count == 0:
+    for cls, name, wrapper in wrappers():
+      originals[cls, name] = cls.__dict__[name]
+      setattr(cls, name, wrapper)
+  enabled_count += 1
+
+def disable():
+  global enabled_count
+  if enabled_count == 0:
+    raise ValueError('instrumentation is not enabled')
+  enabled_count -= 1
+  if enabled_count == 0:
+    for (cls, name), original in originals.items():
+      setattr(cls, name, original)
+    originals.clear()
+
+@contextlib.contextmanager
+def collecting():
+  # statistics are reset when the outermost collection starts
+  if enabled_count == 0:
+    reset()
+  enable()
+  try:
+    yield
+  finally:
+    disable()
@@ -0,0 +1,117 @@
+import collections
+import functools
+import math
+import numbers
+
+import numpy
+
+from .array import QuantityArray
+from .core import Quantity
+from .formula import Formula
+from .parallel import parallel_map
+
+# the errors of the inputs are propagated by evaluating the function once on
+# arrays of samples of all inputs; the samples are drawn in chunks, each with
+# its own random generator spawned from the seed, so that memory is bounded
+# by the chunk size and the results do not depend on how chunks are run
+
+Summary = collections.namedtuple('Summary', ['quantity', 'percentiles'])
+
+# the statistics of a chunk, which are combined across chunks
+Moments = collections.namedtuple('Moments',
+  ['count', 'mean', 'sum_squares', 'sum_errors', 'percentiles', 'units'])
+
+def sample_inputs(formula, args):
+  # gives the system and, for each argument, its value, error and units or
+  # the number itself; the arguments of formulas are in their input units
+  system = formula.system if formula is not None else None
+  inputs = []
+  for index, arg in enumerate(args):
+    if isinstance(arg, Quantity):
+      if system is None:
+        system = arg.system()
+      elif arg.system() is not system:
+        raise TypeError('quantities do not have the same system')
+      if formula is not None:
+        arg = (arg / formula.input_units[index]).expand()
+        if arg.units:
+          raise TypeError('argument {} does not have the units of input {}'
+            .format(index, formula.inputs[index]))
+      inputs.append((arg.value, arg.error, arg.units))
+    elif isinstance(arg, numbers.Real):
+      inputs.append(arg)
+    else:
+      raise TypeError('arguments are not all quantities or numbers')
+  if system is None:
+    raise TypeError('no quantities given')
+  return system, inputs
+
+def run_chunk(function, system, inputs, percentiles, chunk):
+  count, seed = chunk
+  generator = numpy.random.default_rng(seed)
+  args = []
+  for arg in inputs:
+    if isinstance(arg, tuple):
+      value, error, units = arg
+      samples = value + error * generator.standard_normal(count)
+      if isinstance(function, Formula):
+        args.append(samples)
+      else:
+        args.append(QuantityArray(samples, 0, units, system))
+    else:
+      args.append(arg)
+  result = function(*args)
+  if isinstance(result, (QuantityArray, Quantity)):
+    if result.system() is not system:
+      raise TypeError('result does not have the system of the arguments')
+    values, errors, units = result.value, result.error, result.units
+  else:
+    values, errors, units = result, 0, {}
+  values, errors = [numpy.broadcast_to(numpy.asarray(array, dtype=float),
+    (count,)) for array in (values, errors)]
+  mean = values.mean()
+  return Moments(count, mean, float(((values - mean)**2).sum()),
+    float(errors.dot(errors)),
+    numpy.percentile(values, percentiles) if percentiles else [], units)
+
+def combine(first, second):
+  # combines the means and sums of squared deviations of two chunks
+  count = first.count + second.count
+  delta = second.mean - first.mean
+  if first.units != second.units:
+    raise TypeError('results of chunks do not have the same units')
+  return Moments(count, first.mean + delta * second.count / count,
+    first.sum_squares + second.sum_squares +
+      delta**2 * first.count * second.count / count,
+    first.sum_errors + second.sum_errors,
+    numpy.add(numpy.multiply(first.percentiles, first.count),
+      numpy.multiply(second.percentiles, second.count)) / count,
+    first.units)
+
+def propagate(function, *args, samples=100000, seed=None, percentiles=(),
+    chunk_size=1000000, processes=1):
+  # the function is called with arrays of samples of the quantities among the
+  # arguments; errors that it propagates itself, such as those of constants
+  # it uses, are added in quadrature to the spread of the samples;
+  # percentiles of several chunks are the means of those of each chunk
+  formula = function if isinstance(function, Formula) else None
+  system, inputs = sample_inputs(formula, args)
+  if samples < 2:
+    raise ValueError('at least two samples are needed')
+  counts = [chunk_size] * (samples // chunk_size)
+  if samples % chunk_size:
+    counts.append(samples % chunk_size)
+  seeds = numpy.random.SeedSequence(seed).spawn(len(counts))
+  percentiles = list(percentiles)
+  # each chunk is a large piece of work, so chunks are sent one at a time
+  chunks = parallel_map(
+    functools.partial(run_chunk, function, system, inputs, percentiles),
+    zip(counts, seeds), processes, chunk_size=1)
+  result = chunks[0]
+  for chunk in chunks[1:]:
+    result = combine(result, chunk)
+  error = math.sqrt(result.sum_squares / (result.count - 1) +
+    result.sum_errors / result.count)
+  return Summary(Quantity(float(result.mean), error, result.units, system),
+    {percentile: Quantity(float(value), 0, result.units, system)
+      for percentile, value in zip(percentiles, result.percentiles)})
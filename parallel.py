@@ -0,0 +1,22 @@
+import concurrent.futures
+import math
+import os
+
+# quantities are sent to processes with their systems pickled by name, so
+# that each item costs little more than its values; items are sent in chunks
+# to amortize the cost of each message when the work per item is small
+
+def parallel_map(function, items, processes=None, chunk_size=None):
+  # the function must be defined at the top level of a module, so that it
+  # can be pickled
+  items = list(items)
+  if processes is None:
+    processes = os.cpu_count() or 1
+  if processes <= 1 or len(items) <= 1:
+    return [function(item) for item in items]
+  if chunk_size is None:
+    # a few chunks per process balance the load without many messages
+    chunk_size = max(1, math.ceil(len(items) / (4 * processes)))
+  processes = min(processes, math.ceil(len(items) / chunk_size))
+  with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+    return list(executor.map(function, items, chunksize=chunk_size))
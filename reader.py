@@ -0,0 +1,88 @@
+import math
+import re
+
+from .core import Quantity
+
+# strings are parsed in the forms given by format(), such as
+# '(9.810 ± 0.010) m s^(-2)', '(6.02 ± 0.12)e+23' and '1.23(4)e-5 kg', or
+# plain values followed by units; units are parsed by the system, which caches
+# them since the units of many quantities are written in the same way
+
+number = r'[-+]?(?:\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?|inf|nan)'
+mantissa = r'[-+]?(?:\d+\.?\d*|\.\d+|inf|nan)'
+plus_minus = r'\s*(?:\xb1|\+/-)\s*'
+
+quantity_pattern = re.compile(r'''\s*(?:
+  \(\s*(?P<s_value>{mantissa}){plus_minus}(?P<s_error>{number})\s*\)
+    (?:e(?P<s_exponent>[-+]?\d+))? |
+  (?P<u_value>{number}){plus_minus}(?P<u_error>{number}) |
+  (?P<p_open>\()?(?P<p_value>{mantissa})\((?P<p_error>\d+|{number})\)
+    (?(p_open)\))(?:e(?P<p_exponent>[-+]?\d+))? |
+  (?P<value>{number})
+  )(?:\s+(?P<units>\S.*?))?\s*$'''.format(
+  number=number, mantissa=mantissa, plus_minus=plus_minus), re.VERBOSE)
+
+def scaled(string, exponent):
+  value = float(string)
+  if exponent and math.isfinite(value):
+    value = float('{}e{}'.format(string, exponent))
+  return value
+
+def parse_values(string):
+  # gives the value, error and units string
+  match = quantity_pattern.match(string)
+  if match is None:
+    raise ValueError('invalid quantity {!r}'.format(string))
+  groups = match.groupdict()
+  if groups['value'] is not None:
+    return float(groups['value']), 0.0, groups['units']
+  elif groups['u_value'] is not None:
+    return (float(groups['u_value']), float(groups['u_error']),
+      groups['units'])
+  elif groups['s_value'] is not None:
+    exponent = groups['s_exponent']
+    return (scaled(groups['s_value'], exponent),
+      scaled(groups['s_error'], exponent), groups['units'])
+  value, error = groups['p_value'], groups['p_error']
+  exponent = int(groups['p_exponent'] or 0)
+  if error.isdigit() and value[-1:].isdigit():
+    # the error is given in units of the last digit of the value
+    error = scaled(error, exponent - len(value.partition('.')[2]))
+  else:
+    error = float(error)
+  return scaled(value, exponent), error, groups['units']
+
+class QuantityReader:
+  def __init__(self, system):
+    self.system = system
+
+  def parse(self, string):
+    value, error, units = parse_values(string)
+    return Quantity(value, error, self.system.parse_units(units or ''),
+      self.system)
+
+  def read(self, lines):
+    # lines may be any iterable of strings, such as a file or a column of a
+    # CSV file; blank lines are skipped
+    for line in lines:
+      if line.strip():
+        yield self.parse(line)
+
+  def read_arrays(self, lines, chunk_size=10000):
+    # consecutive quantities with the same units are gathered into arrays of
+    # at most chunk_size quantities
+    from .array import QuantityArray
+    values, errors, units = [], [], None
+    for line in lines:
+      if not line.strip():
+        continue
+      value, error, units_string = parse_values(line)
+      line_units = self.system.parse_units(units_string or '')
+      if values and (line_units is not units or len(values) == chunk_size):
+        yield QuantityArray(values, errors, units, self.system)
+        values, errors = [], []
+      units = line_units
+      values.append(value)
+      errors.append(error)
+    if values:
+      yield QuantityArray(values, errors, units, self.system)
@@ -0,0 +1,160 @@
+import ast
+import asyncio
+import functools
+import json
+import math
+import sys
+
+from .core import Quantity
+from .snapshot import defined_systems
+from .util import Importer
+
+# requests are JSON objects on separate lines, such as
+# {"system": "si", "expr": "G*MSun/c**2", "to": "AU", "format": "3s"}, and
+# each is answered on a line in the same order with the value, error and
+# units of the result, or with the exception raised; whatever has been
+# received is processed as a single batch, whose responses are written at once
+
+allowed_nodes = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name,
+  ast.Constant, ast.Load, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow,
+  ast.UAdd, ast.USub)
+
+# exceptions that are reported to the client instead of stopping the server
+request_errors = (ArithmeticError, LookupError, NameError, RecursionError,
+  SyntaxError, TypeError, ValueError)
+
+@functools.lru_cache(maxsize=1024)
+def compile_expression(expression):
+  # expressions may only do arithmetic on numbers and the variables of a
+  # system, and call the extended functions; numbers are made floats, so that
+  # powers cannot produce huge integers
+  tree = ast.parse(expression, mode='eval')
+  for node in ast.walk(tree):
+    if not isinstance(node, allowed_nodes):
+      raise ValueError('{} is not allowed in expressions'.format(
+        type(node).__name__))
+    if isinstance(node, ast.Constant):
+      if type(node.value) not in (int, float):
+        raise ValueError('only numbers are allowed in expressions')
+      node.value = float(node.value)
+    elif isinstance(node, ast.Call):
+      if not isinstance(node.func, ast.Name) or node.keywords:
+        raise ValueError('only functions can be called, with positional '
+          'arguments')
+  return compile(tree, '<expression>', 'eval')
+
+class Namespace(dict):
+  # names of prefixed units are looked up in the system when first used, as
+  # in the modules of systems
+  def __init__(self, system):
+    super().__init__()
+    self.system = system
+
+  def __missing__(self, name):
+    unit = None if name.startswith('_') else self.system.unit_for_symbol(name)
+    if unit is None:
+      raise KeyError(name)
+    result = self[name] = Quantity(1, 0, {unit: 1}, self.system)
+    return result
+
+@functools.lru_cache(maxsize=None)
+def namespace(name):
+  scope = Namespace(defined_systems[name])
+  Importer.inject_variables(defined_systems[name], scope)
+  del scope['system']
+  Importer.inject_extended_functions(scope)
+  scope.setdefault('pi', math.pi)
+  # names are looked up in this scope only
+  scope['__builtins__'] = {}
+  return scope
+
+def evaluate(request):
+  name = request.get('system', 'si')
+  if name not in defined_systems:
+    raise ValueError('unknown system {}'.format(name))
+  system = defined_systems[name]
+  scope = namespace(name)
+  result = eval(compile_expression(request['expr']), scope)
+  if 'to' in request:
+    result = result / eval(compile_expression(request['to']), scope)
+  if not isinstance(result, Quantity):
+    result = Quantity(result, 0, {}, system)
+  result = result.expand()
+  if 'to' in request:
+    if result.units:
+      raise TypeError('units of the result are not those of {}'.format(
+        request['to']))
+    units_string = request['to']
+  else:
+    units_string = system.format_units(result.units)
+  error_sigfig, mode = system.parse_format_spec(request.get('format', ''))
+  return {
+    'value': result.value,
+    'error': result.error,
+    'units': units_string,
+    'formatted': system.format_item(result.value, result.error, units_string,
+      error_sigfig, mode, False)}
+
+def handle_batch(lines):
+  # lines may be strings or UTF-8 encoded bytes
+  responses = []
+  for line in lines:
+    if not line.strip():
+      continue
+    request = None
+    try:
+      request = json.loads(line)
+      if not isinstance(request, dict):
+        raise ValueError('request is not an object')
+      response = evaluate(request)
+    except request_errors as exception:
+      response = {'exception': '{}: {}'.format(type(exception).__name__,
+        exception)}
+    if isinstance(request, dict) and 'id' in request:
+      response['id'] = request['id']
+    responses.append(json.dumps(response))
+  return responses
+
+def split_lines(pending, data):
+  # gives the complete lines and the incomplete rest; at the end of the
+  # input, given by empty data, the rest is complete
+  lines = (pending + data).split(b'\n')
+  pending = lines.pop() if data else b''
+  return lines, pending
+
+def encode_responses(responses):
+  return ''.join(response + '\n' for response in responses).encode()
+
+async def serve_streams(reader, writer, chunk_size=65536):
+  pending = b''
+  try:
+    while True:
+      data = await reader.read(chunk_size)
+      lines, pending = split_lines(pending, data)
+      responses = handle_batch(lines)
+      if responses:
+        writer.write(encode_responses(responses))
+        await writer.drain()
+      if not data:
+        break
+  finally:
+    writer.close()
+
+async def serve_unix(path):
+  server = await asyncio.start_unix_server(serve_streams, path)
+  async with server:
+    await server.serve_forever()
+
+def serve_stdio(chunk_size=65536):
+  pending = b''
+  while True:
+    # read1 returns whatever is available, so that requests are answered
+    # before more are sent
+    data = sys.stdin.buffer.read1(chunk_size)
+    lines, pending = split_lines(pending, data)
+    responses = handle_batch(lines)
+    if responses:
+      sys.stdout.buffer.write(encode_responses(responses))
+      sys.stdout.buffer.flush()
+    if not data:
+      break
@@ -0,0 +1,171 @@
+import collections.abc
+import functools
+import os
+import pickle
+import re
+import sys
+import threading
+import zlib
+
+from .core import UnitSystem
+from .define import builders, defined_system_names
+
+# building a unit system evaluates every definition of it in define.py, so
+# each built system is saved to a cache file and loaded instead on later
+# imports; the files are keyed by a checksum of the sources of the package,
+# since the classes of pickled objects and the functions computing their
+# values may be defined in any of its modules
+
+# cache files are not written if this environment variable is set, e.g. for
+# read-only or shared installations
+no_write_variable = 'PHYSICAL_NO_CACHE_WRITE'
+
+class Systems(collections.abc.Mapping):
+  # maps names to systems, which are obtained only when first accessed
+  def __init__(self, names, get_system, correlated=False, frozen=True):
+    self.names = list(names)
+    self.get_system = get_system
+    # whether systems are built with correlated constants
+    self.correlated = correlated
+    self.frozen = frozen
+    self.loaded = {}
+    # each system is loaded by a single thread, so that all threads share
+    # the same object; building a system gets the systems it is built from,
+    # so the lock is reentrant
+    self.lock = threading.RLock()
+
+  def __getitem__(self, name):
+    try:
+      return self.loaded[name]
+    except KeyError:
+      if name not in self.names:
+        raise
+    with self.lock:
+      try:
+        return self.loaded[name]
+      except KeyError:
+        pass
+      result = self.get_system(name)
+      # the systems of the package are shared, and are only read once loaded
+      if self.frozen:
+        result.freeze()
+      self.loaded[name] = result
+    return result
+
+  def __iter__(self):
+    return iter(self.names)
+
+  def __len__(self):
+    return len(self.names)
+
+def cache_directory():
+  directory = os.environ.get('XDG_CACHE_HOME')
+  if not directory:
+    directory = os.path.join(os.path.expanduser('~'), '.cache')
+  return os.path.join(directory, __package__)
+
+@functools.lru_cache(maxsize=None)
+def source_checksum():
+  checksum = zlib.crc32('{}.{}'.format(*sys.version_info).encode())
+  directory = os.path.dirname(__file__)
+  for name in sorted(os.listdir(directory)):
+    if name.endswith('.py'):
+      with open(os.path.join(directory, name), 'rb') as file:
+        checksum = zlib.crc32(file.read(), checksum)
+  return checksum
+
+def cache_path(name, directory=None):
+  if directory is None:
+    directory = cache_directory()
+  return os.path.join(directory,
+    '{}-{:08x}.pickle'.format(name, source_checksum()))
+
+class SystemPickler(pickle.Pickler):
+  # systems are saved by value, even those that would be pickled by name
+  def reducer_override(self, obj):
+    if isinstance(obj, UnitSystem):
+      return object.__reduce_ex__(obj, pickle.HIGHEST_PROTOCOL)
+    return NotImplemented
+
+def build_systems(frozen=True):
+  # builds all systems afresh, without using the cache; systems that are not
+  # frozen can be changed, with their constants updated in the systems that
+  # translate them
+  built_systems = Systems(builders,
+    lambda name: builders[name](built_systems), frozen=frozen)
+  return dict(built_systems)
+
+def save_systems(systems, directory=None):
+  paths = []
+  for name, system in systems.items():
+    path = cache_path(name, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # the file is replaced atomically, since other processes may be reading it
+    temporary_path = '{}.{}'.format(path, os.getpid())
+    try:
+      with open(temporary_path, 'wb') as file:
+        SystemPickler(file, pickle.HIGHEST_PROTOCOL).dump(system)
+      os.replace(temporary_path, path)
+    except BaseException:
+      if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+      raise
+    remove_stale_files(name, path)
+    paths.append(path)
+  return paths
+
+def remove_stale_files(name, path):
+  # files of the same system saved by other versions of the package are
+  # removed, unless other processes have removed them already
+  directory, current = os.path.split(path)
+  pattern = re.compile(r'{}-[0-9a-f]{{8}}\.pickle$'.format(re.escape(name)))
+  for file_name in os.listdir(directory):
+    if file_name != current and pattern.match(file_name):
+      try:
+        os.remove(os.path.join(directory, file_name))
+      except OSError:
+        pass
+
+def load_system(name):
+  try:
+    with open(cache_path(name), 'rb') as file:
+      system = pickle.load(file)
+    if isinstance(system, UnitSystem):
+      return system
+  except Exception:
+    # a missing, stale or damaged cache file is rebuilt below
+    pass
+  system = builders[name](systems)
+  if os.environ.get(no_write_variable):
+    return system
+  try:
+    save_systems({name: system})
+  except OSError:
+    # the package still works without a writable cache directory
+    pass
+  return system
+
+systems = Systems(builders, load_system)
+
+defined_systems = Systems(defined_system_names, systems.__getitem__)
+
+# systems with correlated constants are built in the same way, on request
+correlated_systems = Systems(builders,
+  lambda name: builders[name](correlated_systems), correlated=True)
+
+def system_key(system):
+  # gives the name of a loaded system and whether it is correlated, or None
+  for registry in [systems, correlated_systems]:
+    for name, loaded_system in registry.loaded.items():
+      if loaded_system is system:
+        return name, registry.correlated
+  return None
+
+def get_system(name, correlated=False):
+  return (correlated_systems if correlated else systems)[name]
+
+def correlated_system(system):
+  for name in defined_systems:
+    if systems.loaded.get(name) is system:
+      return correlated_systems[name]
+  raise ValueError('system has no correlated counterpart')
@@ -1,17 +1,36 @@
+import concurrent.futures
+import fractions
+import gc
 import math
-import re
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
-import urllib.error
-import urllib.request
 
 from .core import Quantity
-from .define import defined_systems
+from .func import exp
+from .snapshot import defined_systems
+
+try:
+  import numpy
+  from .array import QuantityArray
+except ImportError:
+  numpy = None
 
 si = defined_systems['si']
 esu = defined_systems['esu']
 emu = defined_systems['emu']
 gauss = defined_systems['gauss']
 
+def kinetic_energy(m, v):
+  return m * v**2 / 2
+
+def attenuation(x):
+  return exp(-x / Quantity(1, 0, {'Meter': 1}, si))
+
 class PhysicalQuantitiesTest(unittest.TestCase):
   def assert_quantity_equal(self, first, second):
     self.assertAlmostEqual(first.value, second.value)
@@ -132,6 +151,737 @@ class PhysicalQuantitiesTest(unittest.TestCase):
     b = Quantity(1, 0, {'Hertz': 1}, si)
     self.assert_quantity_equal(a.expand(), b.expand())
 
+  def test_expansion_cache(self):
+    system = si.copy()
+    a = Quantity(2, 0.1, {'Tesla': 1}, system)
+    b = a.expand()
+    self.assertEqual(system.cache_info().misses, 1)
+    self.assert_quantity_equal(a.expand(), b)
+    self.assertEqual(system.cache_info().hits, 1)
+    self.assertEqual(system.cache_info().currsize, 1)
+    system.add_unit('Gauss', 'G', Quantity(1e-4, 0, {'Tesla': 1}, system))
+    self.assertEqual(system.cache_info(), (0, 0, 0))
+    c = Quantity(1, 0, {'Gauss': 1}, system)
+    self.assertAlmostEqual((c / a).expand().value * 1e4, 0.5)
+    for powers in [[0.5, fractions.Fraction(1, 2)],
+        [fractions.Fraction(1, 2), 0.5]]:
+      system = si.copy()
+      for power in powers:
+        units = Quantity(1, 0, {'AstronomicalUnit': power},
+          system).expand().units
+        self.assertIs(type(units['Meter']), type(power))
+
+  def test_compact_representation(self):
+    a = Quantity(1, 0.2, {'Kilogram': 1, 'Meter': 1}, si)
+    b = (Quantity(3, 0.4, {'Meter': 1}, si) *
+      Quantity(2, 0, {'Kilogram': 1}, si))
+    c = Quantity(1, 0, {'Meter': 0.5}, si)
+    d = Quantity(1, 0, {'Meter': fractions.Fraction(1, 2)}, si)
+    self.assertIs(a.units, b.units)
+    self.assertIs(a.system, b.system)
+    self.assertEqual(a.units, {'Meter': 1, 'Kilogram': 1})
+    self.assertEqual(c.units, d.units)
+    self.assertIsNot(c.units, d.units)
+    self.assertEqual(str(d), '1 m^(1/2)')
+    self.assertIs(a.system(), si)
+    self.assertFalse(hasattr(a, '__dict__'))
+    with self.assertRaises(TypeError): a.units['Meter'] = 2
+    # units are only interned while they are used
+    from .core import Units
+    key = Quantity(1, 0, {'Meter': 12345}, si).units.key
+    gc.collect()
+    self.assertNotIn(key, Units.interned)
+
+  @unittest.skipIf(numpy is None, 'NumPy is not installed')
+  def test_quantity_array(self):
+    a = [Quantity(1, 0.2, {'Newton': 1}, si),
+      Quantity(2, 0.3, {'Newton': 1}, si)]
+    b = Quantity(3, 0.4, {'Kilogram': 1, 'Meter': 1, 'Second': -2}, si)
+    c = Quantity(4, 0.5, {'Meter': 1}, si)
+    x = QuantityArray.from_quantities(a)
+    for y, z in [(x + b, [p + b for p in a]), (b - x, [b - p for p in a]),
+        (x * c, [p * c for p in a]), (c / x, [c / p for p in a]),
+        (x ** 3, [p ** 3 for p in a]), (-x * 2, [-p * 2 for p in a])]:
+      for p, q in zip(y, z):
+        self.assert_quantity_equal(p, q)
+    d = QuantityArray([1, 2], [0.1, 0.2], {}, si)
+    e = Quantity(2, 0.3, {}, si)
+    for p, q in zip(d ** e, [Quantity(1, 0.1, {}, si) ** e,
+        Quantity(2, 0.2, {}, si) ** e]):
+      self.assert_quantity_equal(p, q)
+    self.assertEqual((x * numpy.array([[1], [2]])).shape, (2, 2))
+    self.assertTrue(numpy.shares_memory(x[1:].value, x.value))
+    self.assert_quantity_equal(x[1], a[1])
+    with self.assertRaises(TypeError): x + c
+    with self.assertRaises(TypeError): x + 1
+
+  def test_dimensions(self):
+    a = Quantity(1, 0.2, {'Newton': 1}, si)
+    b = Quantity(3, 0.4, {'Newton': 1}, si)
+    c = Quantity(1, 0, {'Joule': 1, 'Meter': -1}, si)
+    self.assertEqual(si.dimension(a.units), si.dimension(c.units))
+    self.assertNotEqual(si.dimension(a.units), si.dimension({'Meter': 1}))
+    self.assertEqual(si.dimension({'Henry': -1/2, 'Farad': -1/2}),
+      si.dimension({'Hertz': 1}))
+    self.assert_quantity_equal(a + b, Quantity(4, 0.2 * math.sqrt(5),
+      {'Newton': 1}, si))
+    self.assert_quantity_equal(a - c, Quantity(0, 0.2,
+      {'Kilogram': 1, 'Meter': 1, 'Second': -2}, si))
+
+  def test_compile(self):
+    G = si.get_constant('GravitationalConstant')
+    c = si.get_constant('LightSpeed')
+    f = si.compile(lambda M: G*M/c**2, {'M': 'Kilogram'})
+    a = Quantity(2e30, 1e27, {'Kilogram': 1}, si)
+    self.assertEqual(f.units, {'Meter': 1})
+    self.assert_quantity_equal(f(2e30, errors=[1e27]), (G*a/c**2).expand())
+    a = Quantity(2e30, 0, {'Kilogram': 1}, si)
+    self.assert_quantity_equal(f(M=2e30), (G*a/c**2).expand())
+    g = si.compile(lambda x, y: 2**(x/y) - 1,
+      {'x': {'Meter': 1}, 'y': Quantity(1e-2, 0, {'Meter': 1}, si)})
+    self.assert_quantity_equal(g(3, 100, errors={'x': 0.1}),
+      2**Quantity(3, 0.1, {}, si) - 1)
+    with self.assertRaises(TypeError):
+      g(3, 100, errors=[0.1])
+    with self.assertRaises(TypeError):
+      g(3, 100, errors={'z': 0.1})
+    with self.assertRaises(TypeError):
+      si.compile(lambda M: M + c, {'M': 'Kilogram'})
+    with self.assertRaises(TypeError):
+      si.compile(lambda M: M ** M, {'M': 'Kilogram'})
+
+  @unittest.skipIf(numpy is None, 'NumPy is not installed')
+  def test_vectorized_functions(self):
+    from .func import atan2, exp, log, log1p, sqrt
+    a = [Quantity(0.5, 0.1, {}, si), Quantity(2, 0.2, {}, si)]
+    b = Quantity(3, 0.3, {'Second': 1, 'Hertz': 1}, si)
+    x = QuantityArray.from_quantities(a)
+    for p, q in zip(exp(x), [exp(y) for y in a]):
+      self.assert_quantity_equal(p, q)
+    for p, q in zip(log(x, 10), [log(y, 10) for y in a]):
+      self.assert_quantity_equal(p, q)
+    for p, q in zip(log1p(x), [log1p(y) for y in a]):
+      self.assert_quantity_equal(p, q)
+    for p, q in zip(atan2(x, b), [atan2(y, b) for y in a]):
+      self.assert_quantity_equal(p, q)
+    for p, q in zip(sqrt(x), [sqrt(y) for y in a]):
+      self.assert_quantity_equal(p, q)
+    self.assertTrue(numpy.allclose(exp(numpy.arange(3)), numpy.exp([0, 1, 2])))
+    with self.assertRaises(TypeError):
+      exp(QuantityArray([1, 2], 0, {'Meter': 1}, si))
+
+  def test_convert(self):
+    from . import convert
+    cgs = defined_systems['cgs']
+    a = convert(si.get_constant('GravitationalConstant'), 'cgs')
+    self.assert_quantity_equal(a,
+      cgs.get_constant('GravitationalConstant').expand())
+    a = convert(si.get_constant('ElementaryCharge'), esu)
+    self.assert_quantity_equal(a * 1e10,
+      esu.get_constant('ElementaryCharge').expand() * 1e10)
+    a = convert(si.get_constant('BohrMagneton'), 'gauss', through='emu')
+    self.assert_quantity_equal(a * 1e20,
+      gauss.get_constant('BohrMagneton').expand() * 1e20)
+    a = convert(Quantity(1, 0, {'Erg': 1}, esu), 'si')
+    self.assertAlmostEqual(a.value, 1e-7)
+    self.assertEqual(a.units, {'Kilogram': 1, 'Meter': 2, 'Second': -2})
+    with self.assertRaises(TypeError):
+      convert(si.get_constant('ElementaryCharge'), 'gauss')
+    with self.assertRaises(TypeError):
+      convert(Quantity(1, 0, {'Statcoulomb': 1}, esu), 'si')
+    # prefixed units are converted as the units they are based on
+    a = convert(si.quantity(3, 'km'), 'cgs')
+    self.assertAlmostEqual(a.value, 3e5)
+    self.assertEqual(a.units, {'Centimeter': 1})
+    a = convert(cgs.quantity(2, 'kg'), 'si')
+    self.assertAlmostEqual(a.value, 2)
+    self.assertEqual(a.units, {'Kilogram': 1})
+    for quantity, system in [(Quantity(1, 0, {'Erg': 1}, esu), 'gauss'),
+        (si.get_constant('BohrMagneton'), 'cgs')]:
+      with self.assertRaises(ValueError):
+        convert(quantity, system, through='esu')
+    if numpy is not None:
+      a = convert(QuantityArray([1, 2], 0.1, {'Joule': 1}, si), 'cgs')
+      self.assertEqual(list(a.value), [1e7, 2e7])
+      self.assertEqual(list(a.error), [1e6, 1e6])
+
+  def test_snapshot(self):
+    from . import snapshot
+    from .snapshot import build_systems, save_systems
+    with tempfile.TemporaryDirectory() as directory:
+      # files saved by other versions of the package are replaced, and other
+      # files are kept
+      for name in ['si-00000000.pickle', 'si_to_cgs-00000000.pickle',
+          'sis-00000000.pickle']:
+        open(os.path.join(directory, name), 'wb').close()
+      systems = {}
+      for path in save_systems(build_systems(), directory):
+        with open(path, 'rb') as file:
+          systems[os.path.basename(path).split('-')[0]] = pickle.load(file)
+      self.assertEqual(len(os.listdir(directory)), len(systems) + 1)
+      self.assertIn('sis-00000000.pickle', os.listdir(directory))
+      self.assertEqual(os.path.basename(snapshot.cache_path('si', directory)),
+        'si-{:08x}.pickle'.format(snapshot.source_checksum()))
+    with tempfile.TemporaryDirectory() as directory:
+      environ = dict(os.environ)
+      os.environ.update({'XDG_CACHE_HOME': directory,
+        snapshot.no_write_variable: '1'})
+      try:
+        self.assertIn('Meter', snapshot.load_system('si').units)
+      finally:
+        os.environ.clear()
+        os.environ.update(environ)
+      self.assertEqual(os.listdir(directory), [])
+    for name, system in defined_systems.items():
+      loaded = systems[name]
+      self.assertIs(loaded.reference(), loaded)
+      self.assertEqual(loaded.units.keys(), system.units.keys())
+      for constant, data in system.constants.items():
+        definition = loaded.constants[constant]['definition']
+        self.assertIs(definition.system, loaded.reference)
+        self.assertEqual(definition.value, data['definition'].value)
+        self.assertEqual(definition.error, data['definition'].error)
+        self.assertEqual(definition.units, data['definition'].units)
+    a = systems['si'].get_constant('GravitationalConstant') * Quantity(
+      1, 0, {'Kilogram': 1}, systems['si'])
+    self.assertAlmostEqual(a.expand().value,
+      si.get_constant('GravitationalConstant').expand().value)
+
+  def test_format_many(self):
+    quantities = [
+      Quantity(1.5, 0, {}, si), Quantity(-1234.5678, 0.0321, {}, si),
+      Quantity(0, 0.001, {'Meter': 1}, si), Quantity(2, 0, {'Meter': 1}, si),
+      Quantity(6.02e23, 1.2e18, {'Mole': -1}, si),
+      Quantity(9.81, 0.01, {'Meter': 1, 'Second': -2}, si),
+      Quantity(float('inf'), 1, {'Kilogram': fractions.Fraction(1, 2)}, si)]
+    for format_spec in ['', '2s', '3p', '1s', 'p']:
+      self.assertEqual(list(si.format_many(quantities, format_spec)),
+        [format(quantity, format_spec) for quantity in quantities])
+    self.assertEqual(list(si.format_many(quantities[4:6], columns=True)),
+      [('(6.020000 \xb1 0.000012)e+23', 'mol^(-1)'),
+        ('9.810 \xb1 0.010', 'm s^(-2)')])
+    with self.assertRaises(ValueError):
+      list(si.format_many(quantities, 'x'))
+    with self.assertRaises(TypeError):
+      list(si.format_many([Quantity(1, 0, {}, esu)]))
+    if numpy is not None:
+      a = QuantityArray([1, 2.5], [0.1, 0], {'Second': 1}, si)
+      self.assertEqual(list(a.format_many('3p')),
+        [format(quantity, '3p') for quantity in a])
+
+  def test_bench(self):
+    from . import bench
+    for function in bench.scalar_benchmarks(si).values():
+      function()
+    baseline = {'results': {'mul': 1e-6, 'add': 2e-6, 'pow': 3e-6}}
+    results = {'results': {'mul': 1.05e-6, 'add': 3e-6, 'str': 1e-6}}
+    self.assertEqual(bench.compare_results(results, baseline),
+      [('mul', 1e-6, 1.05e-6, 1.05e-6 / 1e-6, False),
+        ('add', 2e-6, 3e-6, 1.5, True)])
+    self.assertFalse(bench.compare_results(results, baseline, 0.6)[1][4])
+    memory = bench.memory_benchmarks(si, count=1000)
+    self.assertEqual(set(memory), {'memory_same_units',
+      'memory_distinct_units', 'memory_released_units'})
+    self.assertLess(memory['memory_released_units'],
+      memory['memory_distinct_units'] / 4)
+    self.assertEqual(bench.compare_results(
+      {'results': {'memory_released_units': 0}},
+      {'results': {'memory_released_units': 0}})[0][3], 1)
+
+  def test_instrument(self):
+    from . import instrument
+    from .core import UnitSystem
+    original = UnitSystem.expand_units
+    with instrument.collecting():
+      a = Quantity(2, 0.1, {'Tesla': 1}, si)
+      format(a.expand(), '2p')
+      list(si.format_many([a, a]))
+    self.assertIs(UnitSystem.expand_units, original)
+    stats = si.stats()
+    self.assertEqual(stats.counts['expand_quantity'], 1)
+    self.assertEqual(stats.counts['expand_units'], 1)
+    self.assertEqual(stats.counts['format'], 3)
+    self.assertGreaterEqual(stats.counts['quantity'], 2)
+    self.assertEqual(stats.max_depth, 2)
+    self.assertEqual(stats.counts.keys(), stats.times.keys())
+    self.assertEqual(esu.stats().counts, {})
+    with self.assertRaises(ValueError):
+      instrument.disable()
+    # calls made by other threads at the same time are nested separately
+    with instrument.collecting():
+      with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        list(executor.map(lambda _: a.expand(), range(100)))
+    self.assertEqual(si.stats().counts['expand_quantity'], 100)
+    self.assertEqual(si.stats().max_depth, 2)
+
+  def test_correlated(self):
+    from .correlated import Correlated
+    x = Correlated.independent(2, 0.1, {'Meter': 1}, si)
+    y = Correlated.independent(3, 0.2, {'Meter': 1}, si)
+    self.assertEqual((x - x).error, 0)
+    self.assertAlmostEqual((x + x).error, 0.2)
+    self.assertAlmostEqual((x * y / x).error, 0.2)
+    self.assertAlmostEqual((x + y).error, math.hypot(0.1, 0.2))
+    self.assertAlmostEqual((x + y).covariance(x - y), 0.1**2 - 0.2**2)
+    self.assertAlmostEqual(x.correlation(2 * x), 1)
+    a = exp(x / Quantity(1, 0, {'Meter': 1}, si) - 2)
+    self.assertAlmostEqual(a.value, 1)
+    self.assertAlmostEqual(a.error, 0.1)
+    a = Quantity(1, 0.1, {'Kilogram': 1}, si) + Correlated.independent(
+      2, 0.1, {'Kilogram': 1}, si)
+    self.assertIsInstance(a, Correlated)
+    self.assertAlmostEqual(a.error, math.hypot(0.1, 0.1))
+    for name in ['FineStructureConstant', 'BohrRadius', 'ThomsonCrossSection']:
+      first = si.get_constant(name)
+      second = si.get_constant(name, correlated=True)
+      self.assertAlmostEqual(second.value / first.value, 1)
+      self.assertAlmostEqual(second.error / first.error, 1)
+    mu0 = si.get_constant('VacuumPermeability', correlated=True)
+    a = si.get_constant({'ElectronClassicalRadius': 1, 'BohrRadius': -1},
+      correlated=True).expand()
+    self.assertAlmostEqual(a.error / a.value, 2 * mu0.error / mu0.value)
+    a = gauss.get_constant('BohrRadius', correlated=True)
+    self.assertAlmostEqual(a.error / gauss.get_constant('BohrRadius').error, 1)
+    # errors of units are correlated within a system, which is released with
+    # the variables for them
+    from . import correlated
+    count = len(correlated.unit_variables)
+    system = si.copy()
+    system.add_unit('Rod', 'rd', Quantity(5, 0.1, {'Meter': 1}, system))
+    rod = Correlated.independent(1, 0, {'Rod': 1}, system)
+    self.assertEqual((rod - rod * 1).expand().error, 0)
+    self.assertAlmostEqual((rod + rod).expand().error, 0.2)
+    self.assertIn(system, correlated.unit_variables)
+    del system, rod
+    gc.collect()
+    self.assertEqual(len(correlated.unit_variables), count)
+
+  @unittest.skipIf(numpy is None, 'NumPy is not installed')
+  def test_monte_carlo(self):
+    from .montecarlo import propagate
+    m = Quantity(2, 0.01, {'Kilogram': 1}, si)
+    v = Quantity(3, 0.02, {'Meter': 1, 'Second': -1}, si)
+    expected = kinetic_energy(m, v)
+    result = propagate(kinetic_energy, m, v, samples=20000, seed=1,
+      percentiles=[50])
+    self.assertEqual(result.quantity.units, expected.units)
+    self.assertAlmostEqual(result.quantity.value, expected.value, places=2)
+    self.assertAlmostEqual(result.quantity.error / expected.error, 1, places=1)
+    self.assertAlmostEqual(result.percentiles[50].value, expected.value,
+      places=2)
+    chunked = propagate(kinetic_energy, m, v, samples=20000, seed=1,
+      chunk_size=5000)
+    self.assertEqual(chunked, propagate(kinetic_energy, m, v, samples=20000,
+      seed=1, chunk_size=5000, processes=2))
+    self.assertAlmostEqual(chunked.quantity.value, expected.value, places=2)
+    f = si.compile(kinetic_energy,
+      {'m': 'Kilogram', 'v': si.get_constant('LightSpeed')})
+    self.assertAlmostEqual(propagate(f, m, v, seed=1).quantity.error,
+      propagate(kinetic_energy, m, v, seed=1).quantity.error)
+    G = si.get_constant('GravitationalConstant')
+    a = propagate(lambda m: G * m, Quantity(2, 0, {'Kilogram': 1}, si))
+    self.assertAlmostEqual(a.quantity.error / (2 * G).error, 1)
+    with self.assertRaises(TypeError):
+      propagate(kinetic_energy, m, Quantity(3, 0.02, {'Meter': 1}, esu))
+    x = Quantity(1, 0.1, {'Meter': 1}, si)
+    self.assertEqual(propagate(attenuation, x, samples=20000, seed=1,
+        chunk_size=5000, processes=2),
+      propagate(attenuation, x, samples=20000, seed=1, chunk_size=5000))
+    # compiled formulas, with steps on pairs, are sent to other processes
+    g = si.compile(lambda x: abs(-attenuation(x)), {'x': 'Meter'})
+    self.assertEqual(pickle.loads(pickle.dumps(g))(1, errors=[0.1]),
+      g(1, errors=[0.1]))
+    self.assertEqual(propagate(g, x, samples=20000, seed=1, chunk_size=5000,
+        processes=2),
+      propagate(g, x, samples=20000, seed=1, chunk_size=5000))
+
+  def test_parse_units(self):
+    self.assertIs(si.parse_units('kg m s^-2'),
+      Quantity(1, 0, {'Newton': 1}, si).expand().units)
+    self.assertEqual(si.parse_units('J/(mol K)'),
+      {'Joule': 1, 'Mole': -1, 'Kelvin': -1})
+    self.assertEqual(si.parse_units('m^(1/2) s^(-3/2)'),
+      {'Meter': fractions.Fraction(1, 2), 'Second': fractions.Fraction(-3, 2)})
+    self.assertEqual(si.parse_units('kg*m**2/s**2 / J'),
+      {'Kilogram': 1, 'Meter': 2, 'Second': -2, 'Joule': -1})
+    self.assertEqual(si.parse_units('1/s'), {'Second': -1})
+    self.assertEqual(si.parse_units('\u03a9 Ohm \u2126'), {'Ohm': 3})
+    self.assertEqual(si.parse_units('angstrom \xc5ngstr\xf6m'),
+      {'\xc5ngstr\xf6m': 2})
+    self.assertIs(si.parse_units(''), si.parse_units('1'))
+    for string in ['m^', '(m', 'm)', 'm^(1/)', 'm//s', '2 m', 'parsec']:
+      with self.assertRaises(ValueError):
+        si.parse_units(string)
+    self.assert_quantity_equal(si.quantity('(9.81 \xb1 0.01) m s^(-2)'),
+      si.quantity(9.81, 'm/s^2', 0.01))
+    self.assertEqual(si.quantity(2, 'J/mol K').units,
+      {'Joule': 1, 'Mole': -1, 'Kelvin': 1})
+    with self.assertRaises(TypeError):
+      si.quantity('1 m', 'm')
+
+  def test_reader(self):
+    from .reader import QuantityReader
+    reader = QuantityReader(si)
+    quantities = [Quantity(9.81, 0.01, {'Meter': 1, 'Second': -2}, si),
+      Quantity(6.02e23, 1.2e21, {}, si),
+      Quantity(1.23e-5, 4e-7, {'Kilogram': 1}, si),
+      Quantity(-2.5, 0, {'Meter': fractions.Fraction(1, 2)}, si),
+      Quantity(float('inf'), 0.1, {'Ohm': 1}, si)]
+    for quantity in quantities:
+      for format_spec in ['', '3s', 'p', '1p']:
+        string = format(quantity, format_spec)
+        result = reader.parse(string)
+        self.assertEqual(format(result, format_spec), string)
+        self.assertIs(result.units, quantity.units)
+    self.assert_quantity_equal(reader.parse('1.23(4)e-5 kg'), quantities[2])
+    self.assert_quantity_equal(reader.parse('(9.81 +/- 0.01) Meter s^(-2)'),
+      quantities[0])
+    for string in ['9.81 m s^', '1 parsec', '(1 ± 2', '']:
+      with self.assertRaises(ValueError):
+        reader.parse(string)
+    lines = ['1 m', '(2.0 ± 0.1) m', '', '3 s', '4 s', '5 s']
+    self.assertEqual([str(quantity) for quantity in reader.read(lines)],
+      ['1.0 m', '(2.00 ± 0.10) m', '3.0 s', '4.0 s', '5.0 s'])
+    if numpy is not None:
+      arrays = list(reader.read_arrays(lines, chunk_size=2))
+      self.assertEqual([len(array) for array in arrays], [2, 2, 1])
+      self.assertEqual(arrays[1].value.tolist(), [3, 4])
+      self.assertEqual(arrays[0].error.tolist(), [0, 0.1])
+      self.assertEqual(arrays[2].units, {'Second': 1})
+
+  def test_pickle(self):
+    from .parallel import parallel_map
+    from .snapshot import correlated_systems
+    a = Quantity(1.5, 0.1, {'Meter': 1}, si)
+    data = pickle.dumps(a)
+    self.assertLess(len(data), 200)
+    self.assert_quantity_equal(pickle.loads(data), a)
+    for system in [si, gauss, correlated_systems['si']]:
+      self.assertIs(pickle.loads(pickle.dumps(system)), system)
+    copy = si.copy()
+    loaded = pickle.loads(pickle.dumps(copy))
+    self.assertIsNot(loaded, copy)
+    self.assertIs(loaded.get_constant('LightSpeed').system(), loaded)
+    if numpy is not None:
+      b = pickle.loads(pickle.dumps(QuantityArray([1, 2], 0.1, {}, gauss)))
+      self.assertIs(b.system(), gauss)
+      self.assertEqual(b.value.tolist(), [1, 2])
+    quantities = [Quantity(-value, 0.1, {'Second': 1}, si)
+      for value in range(10)]
+    for processes in [1, 2]:
+      results = parallel_map(abs, quantities, processes)
+      for value, result in enumerate(results):
+        self.assert_quantity_equal(result,
+          Quantity(value, 0.1, {'Second': 1}, si))
+
+  def test_freeze(self):
+    import concurrent.futures
+    for system in defined_systems.values():
+      self.assertTrue(system.frozen)
+    with self.assertRaises(TypeError):
+      si.add_unit('Gauss', 'G', Quantity(1e-4, 0, {'Tesla': 1}, si))
+    with self.assertRaises(TypeError):
+      si.add_constant('Two', 'two', 2)
+    system = si.copy()
+    system.add_unit('Gauss', 'G', Quantity(1e-4, 0, {'Tesla': 1}, system))
+    self.assertNotIn('Gauss', si.units)
+    self.assertEqual(system.parse_units('G'), {'Gauss': 1})
+    system.freeze()
+    def work(index):
+      units = {'Tesla': 1, 'Unknown{}'.format(index % 7): 1}
+      a = Quantity(index, 0, units, system).expand()
+      return a.value, a.units, system.parse_units('G m^2')
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+      results = list(executor.map(work, range(200)))
+    for index, (value, units, parsed) in enumerate(results):
+      self.assertEqual(value, index)
+      self.assertEqual(units, {'Kilogram': 1, 'Ampere': -1, 'Second': -2,
+        'Unknown{}'.format(index % 7): 1})
+      self.assertEqual(parsed, {'Gauss': 1, 'Meter': 2})
+
+  @unittest.skipIf(numpy is None, 'NumPy is not installed')
+  def test_save_array(self):
+    from .array import load_array, save_array
+    a = QuantityArray([[1, 2], [3, 4]], [0.1, 0.2],
+      {'Centimeter': fractions.Fraction(1, 2), 'Second': -1}, gauss)
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'a')
+      save_array(a, path)
+      b = load_array(path)
+      self.assertIsInstance(b.value.base, numpy.memmap)
+      self.assertIs(b.units, a.units)
+      self.assertIs(b.system(), gauss)
+      self.assertEqual(b.value.tolist(), a.value.tolist())
+      self.assertEqual(b.error.tolist(), a.error.tolist())
+      self.assertEqual(str(b[1]), str(a[1]))
+      self.assertIs(load_array(path, gauss.copy()).units, a.units)
+      with self.assertRaises(ValueError):
+        load_array(path, esu)
+      save_array(QuantityArray([1], 0, {'Statcoulomb': 1}, esu), path)
+      with self.assertRaises(ValueError):
+        load_array(path, si.copy())
+      del b
+      # arrays are renamed into place, and directories holding other files
+      # are not replaced
+      save_array(QuantityArray([1, 2], 0, {'Kilometer': 1}, si), path)
+      self.assertEqual(os.listdir(directory), ['a'])
+      self.assertEqual(str(load_array(path)[1]), '2.0 km')
+      with self.assertRaises(ValueError):
+        save_array(a, directory)
+
+  def test_server(self):
+    import asyncio
+    import json
+    from .server import compile_expression, handle_batch, serve_streams
+    requests = [
+      {'id': 1, 'expr': 'G*MSun/c**2', 'to': 'AU', 'format': '3s'},
+      {'system': 'gauss', 'expr': 'e**2 / a0'},
+      {'expr': 'sqrt(2) * pi'},
+      {'expr': 'km/m'},
+      {'expr': 'kg + m'},
+      {'expr': 'xm'},
+      {'expr': '2*m', 'to': 's'},
+      {'expr': '__import__("os")'},
+      {'expr': 'm.__class__'},
+      {'system': 'mks', 'expr': 'm'}]
+    lines = [json.dumps(request) for request in requests] + ['', '[1]', '{']
+    responses = [json.loads(line) for line in handle_batch(lines)]
+    self.assertEqual(len(responses), len(requests) + 2)
+    a = (si.get_constant('GravitationalConstant') *
+      si.get_constant('SunMass') / si.get_constant('LightSpeed')**2 /
+      Quantity(1, 0, {'AstronomicalUnit': 1}, si)).expand()
+    self.assertEqual(responses[0]['id'], 1)
+    self.assertAlmostEqual(responses[0]['value'] / a.value, 1)
+    self.assertAlmostEqual(responses[0]['error'] / a.error, 1)
+    self.assertEqual(responses[0]['units'], 'AU')
+    self.assertEqual(responses[0]['formatted'], format(a, '3s') + ' AU')
+    # as given in the README
+    self.assertEqual(responses[0]['formatted'],
+      '(9.870629 \u00b1 0.000314)e-09 AU')
+    self.assertEqual(responses[1]['units'], 'cm^2 g s^(-2)')
+    self.assertAlmostEqual(responses[2]['value'], math.sqrt(2) * math.pi)
+    self.assertEqual(responses[2]['units'], '')
+    self.assertEqual(responses[3]['formatted'], '1000.0')
+    for response in responses[4:]:
+      self.assertEqual(list(response), ['exception'])
+    self.assertIs(compile_expression('G*MSun/c**2'),
+      compile_expression('G*MSun/c**2'))
+    async def exchange(path):
+      server = await asyncio.start_unix_server(serve_streams, path)
+      async with server:
+        reader, writer = await asyncio.open_unix_connection(path)
+        writer.write(b'{"expr": "2*m"}\n{"expr": ')
+        await writer.drain()
+        writer.write(b'"3*s"}')
+        writer.write_eof()
+        return await reader.read()
+    with tempfile.TemporaryDirectory() as directory:
+      data = asyncio.run(exchange(os.path.join(directory, 'socket')))
+    self.assertEqual([json.loads(line)['formatted']
+      for line in data.splitlines()], ['2.0 m', '3.0 s'])
+
+  def test_to(self):
+    eV = Quantity(1, 0, {'ElectronVolt': 1}, si)
+    a = Quantity(3.2e-19, 1e-21, {'Joule': 1}, si)
+    self.assert_quantity_equal(a.to(eV), (a / eV).expand() * eV)
+    self.assert_quantity_equal(a.to('eV'), a.to(eV))
+    self.assert_quantity_equal(a.to({'ElectronVolt': 1}), a.to(eV))
+    self.assert_quantity_equal(a.to('kg m^2 s^-2'), a.expand())
+    b = Quantity(2, 0.1, {'Meter': 1, 'Second': -1}, si)
+    self.assert_quantity_equal(b.to('AU/s').to('m/s'), b)
+    with self.assertRaises(TypeError):
+      a.to('m')
+    with self.assertRaises(TypeError):
+      a.to(Quantity(1, 0, {'Erg': 1}, gauss))
+    with self.assertRaises(ValueError):
+      a.to(2 * eV)
+    c = si.get_constant('BohrRadius', correlated=True)
+    self.assertAlmostEqual((c.to('AU').to('m') - c).error / c.error, 0)
+    if numpy is not None:
+      d = QuantityArray([3.2e-19, 6.4e-19], 1e-21, {'Joule': 1}, si).to('eV')
+      self.assertEqual(d.units, {'ElectronVolt': 1})
+      self.assert_quantity_equal(d[0], a.to(eV))
+
+  def test_prefixes(self):
+    from . import si as si_module
+    from .si import nm, GHz, kpc
+    self.assertEqual(nm.units, {'Nanometer': 1})
+    self.assertIs(si_module.nm, nm)
+    self.assertEqual(format(nm), '1 nm')
+    self.assertAlmostEqual((3 * nm).expand().value, 3e-9)
+    self.assertAlmostEqual((1 * GHz).expand().value, 1e9)
+    self.assertAlmostEqual((kpc / si_module.pc).expand().value, 1e3)
+    self.assertEqual(str(si_module.uT), '1 \u03bcT')
+    self.assertEqual(str(si_module.kOhm), '1 k\u2126')
+    self.assertAlmostEqual((2 * si_module.mg).expand().value, 2e-6)
+    self.assertIs(si_module.kg.units, si.parse_units('kg'))
+    with self.assertRaises(AttributeError):
+      si_module.xm
+    # only units marked as prefixable take prefixes
+    for name in ['yd', 'cd', 'ha', 'hd', 'ma']:
+      with self.assertRaises(AttributeError):
+        getattr(si_module, name)
+    a = si.quantity(2, '\xb5m/ms')
+    self.assertEqual(a.units, {'Micrometer': 1, 'Millisecond': -1})
+    self.assert_quantity_equal(a.to('m/s'), Quantity(2e-3, 0,
+      {'Meter': 1, 'Second': -1}, si))
+    self.assertEqual(str(pickle.loads(pickle.dumps(3 * nm))), '3 nm')
+    # frozen systems keep their tables, and prefixed units are only cached
+    self.assertTrue(si.frozen)
+    self.assertNotIn('Nanometer', si.units)
+    self.assertNotIn('Nanometer', si.dimensions)
+    system = si.copy()
+    b = Quantity(1, 0, {'Kilosecond': 1, 'Gigameter': -1}, system)
+    self.assertAlmostEqual(b.expand().value, 1e-6)
+    self.assertEqual(format(b), '1 ks Gm^(-1)')
+    self.assertAlmostEqual((2 * gauss.quantity(1, 'kg')).expand().value, 2e3)
+    c = si.get_constant('BohrRadius', correlated=True).to('pm')
+    self.assertAlmostEqual(c.value, 52.917721, places=5)
+    self.assertAlmostEqual(c.error / c.value, si.get_constant(
+      'BohrRadius').error / si.get_constant('BohrRadius').value)
+
+  def test_update_constant(self):
+    from .core import Definition
+    from .snapshot import build_systems
+    with self.assertRaises(TypeError):
+      si.update_constant('ElectronMass', 1)
+    systems = build_systems(frozen=False)
+    si_system, cgs_system = systems['si'], systems['cgs']
+    radius = si_system.get_constant('BohrRadius')
+    rydberg = si_system.units['RydbergEnergy']['expansion']
+    proton_mass = si_system.get_constant('ProtonMass')
+    si_system.update_constant('ElectronMass',
+      2 * si_system.get_constant('ElectronMass'))
+    self.assertAlmostEqual(
+      si_system.get_constant('BohrRadius').value / radius.value, 0.5)
+    self.assertAlmostEqual(
+      si_system.units['RydbergEnergy']['expansion'].value / rydberg.value, 2)
+    self.assertIs(si_system.get_constant('ProtonMass'), proton_mass)
+    self.assertAlmostEqual(cgs_system.get_constant('BohrRadius').value,
+      100 * si_system.get_constant('BohrRadius').value)
+    self.assertAlmostEqual(
+      systems['gauss'].get_constant('BohrMagneton').value * 2,
+      gauss.get_constant('BohrMagneton').value)
+    si_system.update_constant('FineStructureConstant', Definition(1/137))
+    self.assertAlmostEqual(
+      si_system.get_constant('BohrRadius').value / radius.value,
+      0.5 * 137 * si.get_constant('FineStructureConstant').value)
+    with self.assertRaises(ValueError):
+      si_system.update_constant('LightSpeed',
+        Definition(1, {'BohrRadius': 1}))
+    with self.assertRaises(ValueError):
+      si_system.update_constant('Meter', 1)
+    system = si_system.copy()
+    system.update_constant('GravitationalConstant',
+      2 * system.get_constant('GravitationalConstant'))
+    self.assertAlmostEqual(system.get_constant('SunMass').value /
+      si_system.get_constant('SunMass').value, 0.5)
+    self.assertEqual(cgs_system.get_constant('SunMass').value,
+      defined_systems['cgs'].get_constant('SunMass').value)
+
+  def test_aggregates(self):
+    from . import fsum, prod, weighted_mean, func, si as si_module
+    self.assertIs(fsum, func.fsum)
+    # aggregates are not among the extended functions of the system modules
+    self.assertFalse(hasattr(si_module, 'fsum'))
+    meter = Quantity(1, 0, {'Meter': 1}, si)
+    lengths = [Quantity(1, 0.1, {'Meter': 1}, si),
+      Quantity(200, 10, {'Centimeter': 1}, si), 0]
+    total = fsum(iter(lengths))
+    self.assertEqual(total.units, {'Meter': 1})
+    self.assert_quantity_equal(total, sum(lengths))
+    self.assertEqual(fsum(0.1 * meter for _ in range(10)).value, 1)
+    self.assertEqual(fsum([]), 0)
+    self.assertEqual(fsum([1, Quantity(1, 0, {'Centimeter': 1, 'Meter': -1},
+      si)]).value, 1.01)
+    with self.assertRaises(TypeError):
+      fsum([1, meter])
+    with self.assertRaises(TypeError):
+      fsum([meter, Quantity(1, 0, {'Second': 1}, si)])
+    with self.assertRaises(TypeError):
+      fsum([meter, Quantity(1, 0, {'Centimeter': 1}, gauss)])
+    factors = [Quantity(2, 0.1, {'Meter': 1}, si), 3,
+      Quantity(4, 0.2, {'Second': -1}, si)]
+    self.assert_quantity_equal(prod(factor for factor in factors),
+      factors[0] * factors[1] * factors[2])
+    mean = weighted_mean([Quantity(10, 1, {'Meter': 1}, si),
+      Quantity(1200, 200, {'Centimeter': 1}, si)])
+    self.assert_quantity_equal(mean,
+      Quantity((10 / 1 + 12 / 4) / (1 + 1 / 4), (1 + 1 / 4)**-0.5,
+        {'Meter': 1}, si))
+    with self.assertRaises(ValueError):
+      weighted_mean([meter])
+    radius = si.get_constant('BohrRadius', correlated=True)
+    self.assertEqual(fsum([radius, -radius]).error, 0)
+    self.assertAlmostEqual(fsum([meter, radius, -radius]).value, 1)
+    self.assertAlmostEqual(prod([radius, 1 / radius]).error, 0)
+    self.assertAlmostEqual(weighted_mean([radius, radius]).error, radius.error)
+
+  def test_format_power_types(self):
+    # the powers compare equal, but are displayed differently
+    expected = [(0.5, '1 m^0.5'), (fractions.Fraction(1, 2), '1 m^(1/2)')]
+    for pairs in [expected, expected[::-1]]:
+      system = si.copy()
+      for power, string in pairs:
+        self.assertEqual(str(Quantity(1, 0, {'Meter': power}, system)),
+          string)
+
+  def test_concurrent_loading(self):
+    # threads loading a system at the same time get the same object
+    from .define import builders
+    from .snapshot import Systems
+    registry = Systems(builders, lambda name: builders[name](registry))
+    barrier = threading.Barrier(8)
+    def load(name):
+      barrier.wait()
+      return registry[name]
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+      loaded = list(executor.map(load, ['cgs'] * 8))
+    for system in loaded:
+      self.assertIs(system, loaded[0])
+    a = Quantity(1, 0, {'Centimeter': 1}, loaded[0])
+    self.assertEqual((a + Quantity(1, 0, {'Centimeter': 1}, loaded[1])).value,
+      2)
+
+  def test_interactive_representation(self):
+    # quantities are shown as formatted in interactive sessions
+    script = ('import {0}.si as si; from {0}.util import Importer; '
+      'Importer.inject_interactive_features({{}}); '
+      'a = si.system.get_constant("BohrRadius", correlated=True); '
+      'print(repr(a - a), repr(a * 0 + si.m))'.format(__package__))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.dirname(os.path.dirname(
+      os.path.abspath(__file__)))
+    output = subprocess.check_output([sys.executable, '-c', script], env=env)
+    self.assertEqual(output.strip(), b'0.0 m 1.0 m')
+
+  def test_exit(self):
+    # interned units released at exit are removed without errors, even after
+    # the fractions module has been torn down
+    script = ('from {0}.snapshot import build_systems; '
+      'systems = build_systems(frozen=False); si = systems["si"]; '
+      'si.update_constant("GravitationalConstant", '
+      'si.get_constant("GravitationalConstant") * 1.0001)'.format(__package__))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.dirname(os.path.dirname(
+      os.path.abspath(__file__)))
+    # the order of teardown depends on the hashes of strings
+    for seed in range(3):
+      env['PYTHONHASHSEED'] = str(seed)
+      process = subprocess.run([sys.executable, '-c', script], env=env,
+        stderr=subprocess.PIPE)
+      self.assertEqual(process.stderr, b'')
+
+  def test_import_without_numpy(self):
+    # NumPy is only imported for arrays, as it is slow to import
+    script = ('import sys; import {}.si; print("numpy" in sys.modules)'
+      .format(__package__))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.dirname(os.path.dirname(
+      os.path.abspath(__file__)))
+    output = subprocess.check_output([sys.executable, '-c', script], env=env)
+    self.assertEqual(output.strip(), b'False')
+
   def test_simple_constants(self):
     for system in defined_systems.values():
       a = Quantity(13.6, 0,
@@ -160,52 +910,24 @@ class PhysicalQuantitiesTest(unittest.TestCase):
     self.assertAlmostEqual(a.value * 1e3, d.value * 1e3)
 
   def test_codata(self):
-    url = 'http://physics.nist.gov/cuu/Constants/Table/allascii.txt'
-
-    units = {
-      'AtomicMassUnit':        'unified atomic mass unit'}
-    constants = {
-      'AvogadroConstant':      'Avogadro constant',
-      'ElectronGFactor':       'electron g factor',
-      'ProtonGFactor':         'proton g factor',
-      'NeutronGFactor':        'neutron g factor',
-      'MuonGFactor':           'muon g factor',
-      'LightSpeed':            'speed of light in vacuum',
-      'ElementaryCharge':      'atomic unit of charge',
-      'PlanckConstant':        'Planck constant',
-      'BoltzmannConstant':     'Boltzmann constant',
-      'GravitationalConstant': 'Newtonian constant of gravitation',
-      'VacuumPermeability':    'vacuum mag. permeability',
-      'ElectronMass':          'electron mass',
-      'ProtonMass':            'proton mass',
-      'NeutronMass':           'neutron mass',
-      'MuonMass':              'muon mass'}
-
-    try:
-      response = urllib.request.urlopen(url)
-    except urllib.error.URLError:
-      raise ValueError('Cannot download data.')
-
-    data = iter(response.read().decode('ascii').rstrip('\n').split('\n'))
-    while not next(data).startswith('--'):
-      pass
-    data = (re.split(' {2,}', x) for x in data)
-    def parse_value(x):
-      return float(x.replace(' ', '').replace('...', ''))
-    def parse_error(x):
-      return 0 if x == '(exact)' else float(x.replace(' ', ''))
-    data = {x: (parse_value(y), parse_error(z)) for x, y, z, *_ in data}
-
-    for local_name, codata_name in units.items():
-      quantity = Quantity(1, 0, {local_name: 1}, si).expand()
-      x, y = data[codata_name]
-      assert math.isclose(quantity.value, x)
-      assert math.isclose(quantity.error, y)
-    for local_name, codata_name in constants.items():
-      quantity = si.get_constant(local_name).expand()
-      x, y = data[codata_name]
-      assert math.isclose(quantity.value, x)
-      assert math.isclose(quantity.error, y)
+    from .codata import Entry, compare, read_table, update_constants
+    from .snapshot import build_systems
+    table = read_table()
+    self.assertEqual(table['speed of light in vacuum'],
+      Entry(299792458, 0, 'm s^-1'))
+    self.assertEqual(compare(si, table), [])
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'allascii.txt')
+      with open(path, 'w') as file:
+        file.write('  Quantity  Value  Uncertainty  Unit\n{}\n{}\n'.format(
+          '-' * 40, 'electron mass'.ljust(60) + '9.1 e-31   0.1 e-31   kg'))
+      table = read_table(path)
+    self.assertEqual(compare(si, table), ['ElectronMass'])
+    systems = build_systems(frozen=False)
+    update_constants(systems['si'], table)
+    self.assertEqual(compare(systems['si'], table), [])
+    self.assertAlmostEqual(
+      systems['cgs'].get_constant('ElectronMass').value / 9.1e-28, 1)
 
 if __name__ == '__main__':
   unittest.main()
@@ -1,12 +1,12 @@
 import __main__
 import builtins
-import importlib
+import functools
+import importlib.machinery
 import numbers
 import sys
-import types
 
-from .core import Quantity
-from .define import defined_systems
+from .core import Quantity, english_name
+from .snapshot import defined_systems
 from .func import extended_functions
 
 def expand(quantity=None):
@@ -21,68 +21,59 @@ def expand(quantity=None):
         return quantity
 
 class Importer:
-  fullname_to_system = {'{}.{}'.format(__package__, key): value
-    for key, value in defined_systems.items()}
+  # serves the virtual module of each defined system, which is only built
+  # when the module is first imported
+  fullname_to_name = {'{}.{}'.format(__package__, name): name
+    for name in defined_systems}
 
-  def find_module(self, fullname, path=None):
-    return self if fullname in self.fullname_to_system else None
+  def find_spec(self, fullname, path=None, target=None):
+    if fullname in self.fullname_to_name:
+      return importlib.machinery.ModuleSpec(fullname, self, origin='virtual')
+    return None
 
-  def load_module(self, fullname):
-    if fullname in sys.modules:
-      return sys.modules[fullname]
-    elif fullname in self.fullname_to_system:
-      module = types.ModuleType(fullname)
-      system = self.fullname_to_system[fullname]
-      self.inject_variables(system, module.__dict__)
-      if not hasattr(__main__, '__file__') or sys.flags.interactive:
-        self.inject_interactive_features(module.__dict__)
-      sys.modules[fullname] = module
-      return module
-    else:
-      raise ImportError()
+  def create_module(self, spec):
+    return None
 
-  @staticmethod
-  def module_repr(module):
-    return "<module '{}' (virtual)>".format(module.__name__)
+  def exec_module(self, module):
+    system = defined_systems[self.fullname_to_name[module.__name__]]
+    self.inject_variables(system, module.__dict__)
+    module.__getattr__ = functools.partial(self.prefixed_variable, system,
+      module.__dict__)
+    if not hasattr(__main__, '__file__') or sys.flags.interactive:
+      self.inject_interactive_features(module.__dict__)
 
   @classmethod
   def enable(cls):
-    sys.meta_path.append(cls())
-    # import all virtual modules once, so that they are added to sys.modules
-    # and that they are available even if only the package is imported
-    for fullname in cls.fullname_to_system:
-      importlib.import_module(fullname)
+    if not any(isinstance(finder, cls) for finder in sys.meta_path):
+      sys.meta_path.append(cls())
 
   @staticmethod
   def inject_variables(system, scope):
     scope['system'] = system
-    symbol_to_english = {
-      '\u03b1': 'alpha',    '\u03b2': 'beta',     '\u03b3': 'gamma',
-      '\u03b4': 'delta',    '\u03b5': 'epsilon',  '\u03b6': 'zeta',
-      '\u03b7': 'eta',      '\u03b8': 'theta',    '\u03b9': 'iota',
-      '\u03ba': 'kappa',    '\u03bb': 'lambda',   '\u03bc': 'mu',
-      '\u03bd': 'nu',       '\u03be': 'xi',       '\u03bf': 'omicron',
-      '\u03c0': 'pi',       '\u03c1': 'rho',      '\u03c3': 'sigma',
-      '\u03c4': 'tau',      '\u03c5': 'upsilon',  '\u03c6': 'phi',
-      '\u03c7': 'chi',      '\u03c8': 'psi',      '\u03c9': 'omega',
-      '\xb0':   'deg',      "'":      'arcmin',   '"':      'arcsec',
-      '\u0127': 'hbar',     '\u2126': 'Ohm',      '\u212b': 'angstrom'
-    }
     for unit, data in system.units.items():
-      name = data['symbol']
-      for symbol, english in symbol_to_english.items():
-        name = name.replace(symbol, english)
-      scope[name] = Quantity(1, 0, {unit: 1}, system)
+      scope[english_name(data['symbol'])] = Quantity(1, 0, {unit: 1}, system)
     for data in system.constants.values():
-      name = data['symbol']
-      for symbol, english in symbol_to_english.items():
-        name = name.replace(symbol, english)
-      scope[name] = data['definition']
+      scope[english_name(data['symbol'])] = data['definition']
+
+  @staticmethod
+  def prefixed_variable(system, scope, name):
+    # variables for prefixed units are only made when first used, and are
+    # then kept in the scope
+    unit = system.unit_for_symbol(name) if not name.startswith('_') else None
+    if unit is None:
+      raise AttributeError('module {!r} has no attribute {!r}'.format(
+        scope['__name__'], name))
+    result = scope[name] = Quantity(1, 0, {unit: 1}, system)
+    return result
 
   @classmethod
   def inject_interactive_features(cls, scope):
     scope['Quantity'] = Quantity
     scope['Quantity'].__repr__ = scope['Quantity'].__str__
+    # correlated quantities define their own representation, and are shown
+    # in the same way
+    from .correlated import Correlated
+    Correlated.__repr__ = Correlated.__str__
     scope['expand'] = expand
     cls.inject_extended_functions(scope)
 